@@ -0,0 +1,90 @@
+from collections import OrderedDict
+from hashlib import sha1
+from threading import RLock
+import time
+
+
+class LRUCache(object):
+    """in-process, thread-safe cache which holds at most `maxsize` entries,
+    evicting the least recently used, and expires entries older than `ttl`
+    seconds (never, if `ttl` is None)"""
+
+    def __init__(self, maxsize=1024, ttl=None, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires <= self.timer():
+                self.misses += 1
+                return default
+
+            self._entries[key] = value, expires
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        expires = None
+        if self.ttl is not None:
+            expires = self.timer() + self.ttl
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = value, expires
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
+
+
+class SharedCache(object):
+    """adapts a memcached-style client (any object with ``get(key)``,
+    ``set(key, value, time)`` and ``delete(key)``) so that entries are
+    shared between processes; keys are hashed to fit memcached's limits"""
+
+    def __init__(self, client, ttl=0, prefix='batteries:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def make_key(self, key):
+        return self.prefix + sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        value = self.client.get(self.make_key(key))
+        if value is None:
+            return default
+        return value
+
+    def set(self, key, value):
+        self.client.set(self.make_key(key), value, self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.make_key(key))
@@ -1,10 +1,12 @@
 import logging
 import re
+from itertools import islice
 
 from sqlalchemy.orm.interfaces import EXT_CONTINUE, EXT_STOP
 from sqlalchemy.ext.declarative import declarative_base, DeclarativeMeta, declared_attr
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
-from sqlalchemy import event
+from sqlalchemy import event, and_, or_
+from sqlalchemy.orm import class_mapper, ColumnProperty
 from sqlalchemy.orm.session import Session
 
 from batteries.util import metaproperty
@@ -36,17 +38,184 @@ class MetaModel(DeclarativeMeta):
             if v:
                 return cls.query.get(v)
             if kwargs:
-                q = cls.query
-                for k, v in kwargs.items():
-                    q = q.filter_by(**{k: v})
-                return q.one()
+                cache = cls.__lookup_cache__
+                if cache is not None and is_unique_lookup(cls, kwargs):
+                    return cached_lookup(cls, cache, kwargs)
+                return lookup(cls, kwargs)
 
         except NoResultFound:
             return None
 
+    def get_many(cls, keys, chunk_size=500):
+        """returns the instances identified by `keys`, each a primary key
+        value or a tuple of values for composite keys, in the same order and
+        with None for keys which do not exist.
+
+        Instances already present in the session's identity map are used
+        as-is; the rest are loaded with ``IN`` queries of up to `chunk_size`
+        keys each.
+
+        Loaded instances are matched back to `keys` by Python equality with
+        their primary key values, so keys must be given exactly as those
+        values are loaded: ``1`` rather than ``'1'`` for an integer column,
+        and in their stored case under a case-insensitive collation. Other
+        keys come back as None even where the database matched a row."""
+        mapper = class_mapper(cls)
+        query = cls.query
+        identity_map = query.session.identity_map
+        keys = [k if isinstance(k, tuple) else (k,) for k in keys]
+
+        found = {}
+        missing = []
+        for k in keys:
+            if k in found:
+                continue
+            found[k] = identity_map.get(mapper.identity_key_from_primary_key(list(k)))
+            if found[k] is None:
+                missing.append(k)
+
+        pk = mapper.primary_key
+        for i in range(0, len(missing), chunk_size):
+            chunk = missing[i:i + chunk_size]
+            if len(pk) == 1:
+                criterion = pk[0].in_([k[0] for k in chunk])
+            else:
+                criterion = or_(*[and_(*[c == v for c, v in zip(pk, k)])
+                                  for k in chunk])
+            for instance in query.filter(criterion):
+                found[tuple(mapper.primary_key_from_instance(instance))] = instance
+
+        return [found.get(k) for k in keys]
+
+    def bulk_create(cls, rows, chunk_size=10000, return_keys=False):
+        """inserts `rows`, mappings of attribute names to values, without
+        constructing instances, emitting one executemany per table for each
+        `chunk_size` rows; `rows` may be any iterable, and is consumed one
+        chunk at a time.
+
+        The per-instance ``before_insert`` behavior of the mixins (keys,
+        slugs, timestamps, ...) is applied to each chunk first by calling
+        each ``on_bulk_insert(rows, context)`` classmethod defined along the
+        MRO; `context` is a dict shared by every chunk, so that state such
+        as reserved slugs carries over between them.
+
+        Returns the number of rows inserted or, with `return_keys`, a list
+        of their primary keys, as accepted by :meth:`get_many`.
+
+        Keys generated by the database, such as autoincrement ids, are not
+        read back, so with `return_keys`, or when the class spans several
+        tables, every primary key must be given by the rows or filled in by
+        a hook; a :exc:`ValueError` is raised before inserting a chunk in
+        which one is missing."""
+        mapper = class_mapper(cls)
+        if mapper.polymorphic_on is not None:
+            discriminator = {mapper.polymorphic_on: mapper.polymorphic_identity}
+        else:
+            discriminator = {}
+        hooks = [klass.__dict__['on_bulk_insert'].__get__(None, cls)
+                 for klass in reversed(cls.__mro__)
+                 if 'on_bulk_insert' in klass.__dict__]
+        pk_names = [mapper.get_property_by_column(c).key for c in mapper.primary_key]
+        keys_required = return_keys or len(mapper.tables) > 1
+
+        session = cls.query.session
+        context = {}
+        columns = {}
+        keys = []
+        count = 0
+        rows = iter(rows)
+        while True:
+            chunk = [dict(row) for row in islice(rows, chunk_size)]
+            if not chunk:
+                break
+            for hook in hooks:
+                hook(chunk, context)
+
+            if keys_required:
+                for row in chunk:
+                    for k in pk_names:
+                        if row.get(k) is None:
+                            raise ValueError(
+                                "{0}.bulk_create() requires {1} to be given for each row, "
+                                "since generated keys are not read back".format(cls.__name__, k))
+
+            for row in chunk:
+                for k in row:
+                    if k not in columns:
+                        columns[k] = bulk_insert_columns(cls, k)
+
+            for table in mapper.tables:
+                batches = {}
+                for row in chunk:
+                    params = {}
+                    for k, v in row.items():
+                        for c in columns[k]:
+                            if c.table is table:
+                                params[c.key] = v
+                    for c, v in discriminator.items():
+                        if c.table is table:
+                            params[c.key] = v
+                    batches.setdefault(frozenset(params), []).append(params)
+
+                for params in batches.values():
+                    session.execute(table.insert(), params, mapper=mapper)
+
+            count += len(chunk)
+            if return_keys:
+                for row in chunk:
+                    key = tuple(row.get(k) for k in pk_names)
+                    keys.append(key if len(key) > 1 else key[0])
+
+        return keys if return_keys else count
+
+
+def bulk_insert_columns(cls, k):
+    """the columns written by attribute `k`; a column shared between
+    inherited tables is written to each of them"""
+    prop = getattr(getattr(cls, k, None), 'property', None)
+    if not isinstance(prop, ColumnProperty):
+        raise ValueError("{0}.{1} is not a mapped column".format(cls.__name__, k))
+    return prop.columns
+
+
+def lookup(cls, kwargs):
+    q = cls.query
+    for k, v in kwargs.items():
+        q = q.filter_by(**{k: v})
+    return q.one()
+
+
+def is_unique_lookup(cls, kwargs):
+    """true if any of the `kwargs` names a unique or primary key column"""
+    for k in kwargs:
+        prop = getattr(getattr(cls, k, None), 'property', None)
+        if isinstance(prop, ColumnProperty):
+            if any(c.unique or c.primary_key for c in prop.columns):
+                return True
+    return False
+
+
+def cached_lookup(cls, cache, kwargs):
+    """read-through lookup which caches the primary key of the instance
+    matching `kwargs`; cached keys are verified against the loaded instance,
+    so stale entries are replaced rather than returned"""
+    key = (cls.__module__, cls.__name__, tuple(sorted(kwargs.items())))
+    pk = cache.get(key)
+    if pk is not None:
+        instance = cls.query.get(pk)
+        if instance is not None and \
+                all(getattr(instance, k) == v for k, v in kwargs.items()):
+            return instance
+        cache.delete(key)
+
+    instance = lookup(cls, kwargs)
+    cache.set(key, tuple(class_mapper(cls).primary_key_from_instance(instance)))
+    return instance
+
 
 class Model(object):
     __identifiers__ = None
+    __lookup_cache__ = None
 
     @declared_attr
     def __tablename__(cls):
@@ -1,12 +1,119 @@
 from geoalchemy2.shape import from_shape, to_shape
 from geoalchemy2 import Geometry
-from shapely.geometry import Point, MultiPolygon, Polygon
+from geoalchemy2.elements import WKBElement
+import math
+import struct
+
+from shapely.geometry import Point, MultiPolygon, Polygon, box
+from shapely.geometry.base import BaseGeometry
+from shapely.strtree import STRtree
+from shapely import wkb as shapely_wkb
 from sqlalchemy import event
-from collections import Sequence
+from sqlalchemy.orm import Query
+try:
+    from collections.abc import Sequence
+except ImportError:
+    from collections import Sequence
 
 
 class Geometric(object):
-    pass
+    @classmethod
+    def wkb_values(cls, column, rows):
+        """returns the raw WKB of `column` for each of `rows`, a query for
+        this class or a list of instances, as bytes or None.
+
+        Queries are narrowed to the one column, so that no instances are
+        loaded; instances are read without decoding their geometry."""
+        attribute = cls.__dict__.get(column)
+        if isinstance(attribute, GeometryDescriptor):
+            attribute = attribute.property
+        else:
+            attribute = getattr(cls, column)
+
+        if isinstance(rows, Query):
+            values = (v for v, in rows.with_entities(attribute))
+        else:
+            values = (attribute.__get__(row, cls) for row in rows)
+
+        return [_wkb_bytes(v) for v in values]
+
+    @classmethod
+    def set_points(cls, column, instances, coordinates, srid=None):
+        """assigns (x, y) pairs from `coordinates` to the point `column` of
+        the corresponding `instances`, with the column's SRID unless `srid`
+        is given; the WKB is packed directly, without going through shapely"""
+        cls.__dict__[column].set_many(instances, coordinates, srid)
+
+    @classmethod
+    def spatial_index(cls, column, rows, **kwargs):
+        """returns a :class:`SpatialIndex` over `column` of `rows`, a query
+        for this class or a list of instances"""
+        return SpatialIndex(column, rows, **kwargs)
+
+    @classmethod
+    def point_array(cls, column, rows):
+        """returns the points in `column` for each of `rows` as an (n, 2)
+        NumPy array of x, y, with NaN for NULL.
+
+        Little-endian 2D points, with or without an SRID, are decoded in
+        one pass over the concatenated WKB; anything else falls back to
+        shapely one row at a time. Requires NumPy."""
+        import numpy as np
+
+        blobs = cls.wkb_values(column, rows)
+        points = np.full((len(blobs), 2), np.nan)
+        present = [i for i, b in enumerate(blobs) if b is not None]
+        if not present:
+            return points
+
+        size = len(blobs[present[0]])
+        dtype = _point_dtypes.get(size)
+        data = b''.join(blobs[i] for i in present)
+        if dtype is not None and len(data) == size * len(present):
+            records = np.frombuffer(data, dtype)
+            if (records['order'] == 1).all() and ((records['type'] & 0xffff) == 1).all():
+                points[present, 0] = records['x']
+                points[present, 1] = records['y']
+                return points
+
+        for i in present:
+            p = shapely_wkb.loads(blobs[i])
+            points[i] = p.x, p.y
+        return points
+
+    @classmethod
+    def geometry_array(cls, column, rows):
+        """returns the geometries in `column` for each of `rows` as a NumPy
+        object array of shapely geometries, with None for NULL; decoded in
+        one call with shapely 2's vectorized ``from_wkb`` where available.
+        Requires NumPy."""
+        import numpy as np
+        import shapely
+
+        blobs = cls.wkb_values(column, rows)
+        from_wkb = getattr(shapely, 'from_wkb', None)
+        if from_wkb is not None:
+            return from_wkb(np.array(blobs, dtype=object))
+
+        geometries = np.empty(len(blobs), dtype=object)
+        for i, b in enumerate(blobs):
+            if b is not None:
+                geometries[i] = shapely_wkb.loads(b)
+        return geometries
+
+
+def _wkb_bytes(value):
+    if value is None:
+        return None
+    return bytes(getattr(value, 'data', value))
+
+
+# numpy record layouts of little-endian 2D point WKB, keyed on length; the
+# 25 byte form is EWKB carrying an SRID
+_point_dtypes = {
+    21: [('order', 'u1'), ('type', '<u4'), ('x', '<f8'), ('y', '<f8')],
+    25: [('order', 'u1'), ('type', '<u4'), ('srid', '<u4'), ('x', '<f8'), ('y', '<f8')],
+}
 
 
 @event.listens_for(Geometric, 'mapper_configured', propagate=True)
@@ -15,79 +122,274 @@ def configure_geometric(mapper, target):
         property = getattr(target, k)
         if property.is_attribute and type(column.type) is Geometry:
             if column.type.geometry_type.lower() == 'point':
-                setattr(target, k, PointGeometryDescriptor(property))
+                setattr(target, k, PointGeometryDescriptor(property, column.type.srid))
 
             if column.type.geometry_type.lower() == 'multipolygon':
-                setattr(target, k, MultiPolygonGeometryDescriptor(property))
+                setattr(target, k, MultiPolygonGeometryDescriptor(property, column.type.srid))
 
 
-class PointGeometryDescriptor(object):
-    """descriptor for 2D point geometry"""
+class GeometryDescriptor(object):
+    """base for descriptors which present a geometry column as a shapely
+    geometry.
+
+    The decoded geometry is cached on the instance together with the WKB it
+    came from, and used for as long as the column still holds that same WKB
+    object, so setting, expiring or refreshing the column invalidates it.
+    """
 
-    def __init__(self, property):
+    def __init__(self, property, srid=-1):
         self.property = property
+        self.srid = srid
+        self.cache_key = '_{0}_shape'.format(property.key)
 
     def __get__(self, instance, cls=None):
         if instance is not None:
             wkb = self.property.__get__(instance, cls)
             if wkb is None:
                 return None
-            p = to_shape(wkb)
-            p.to_wkb = lambda: wkb
-            return p
+            cached = instance.__dict__.get(self.cache_key)
+            if cached is not None and cached[0] is wkb:
+                return cached[1]
+            return self.cache_shape(instance, wkb)
 
         elif cls is not None:
             return self.property.__get__(instance, cls)
 
-    def __set__(self, instance, v):
-        if isinstance(v, Point):
-            self.property.__set__(instance, from_shape(v, srid=4326))
+    def cache_shape(self, instance, wkb):
+        """decodes `wkb` and caches the result as the instance's value"""
+        p = to_shape(wkb)
+        p.to_wkb = lambda: wkb
+        instance.__dict__[self.cache_key] = (wkb, p)
+        return p
+
+    def set_encoded(self, instance, v):
+        """stores WKB given as a WKBElement, which is kept as-is, or as
+        bytes, which are wrapped with the column's SRID; returns False for
+        anything else.
+
+        Bytes must start with a WKB byte order marker, so that text such as
+        WKT or hex-encoded WKB, which is also bytes on Python 2, is rejected
+        rather than stored as if it were binary."""
+        if isinstance(v, WKBElement):
+            self.property.__set__(instance, v)
+        elif isinstance(v, _binary_types):
+            if bytearray(v[:1]) not in (b'\x00', b'\x01'):
+                raise ValueError("{0!r} is not binary WKB".format(v[:16]))
+            self.property.__set__(instance, WKBElement(_buffer(v), srid=self.srid))
         else:
+            return False
+        return True
+
+    def set_shape(self, instance, shape, srid=None):
+        """encodes and stores `shape`; the cached value is decoded from the
+        stored WKB, so that `shape` itself is neither modified nor shared
+        between instances"""
+        wkb = from_shape(shape, srid=self.srid if srid is None else srid)
+        self.property.__set__(instance, wkb)
+        self.cache_shape(instance, wkb)
+
+
+class PointGeometryDescriptor(GeometryDescriptor):
+    """descriptor for 2D point geometry"""
+
+    def __set__(self, instance, v):
+        if v is None:
+            self.property.__set__(instance, None)
+        elif isinstance(v, Point):
+            self.set_shape(instance, v)
+        elif not self.set_encoded(instance, v):
             if len(v) == 2 and isinstance(v[0], Sequence):
                 points = v[0]
                 srid = v[1]
             else:
                 points = v
                 srid = None
-            p = Point(*points)
-            self.property.__set__(instance, from_shape(p, srid=srid))
+            self.set_shape(instance, Point(*points), srid)
 
+    def set_many(self, instances, coordinates, srid=None):
+        """assigns each of `coordinates`, (x, y) pairs, to the matching one
+        of `instances`, encoding the WKB directly rather than via shapely"""
+        srid = self.srid if srid is None else srid
+        pack = _point_wkb.pack
+        for instance, (x, y) in zip(instances, coordinates):
+            self.property.__set__(instance, WKBElement(_buffer(pack(1, 1, x, y)), srid=srid))
 
-class MultiPolygonGeometryDescriptor(object):
-    """descriptor for 2D point geometry"""
-
-    def __init__(self, property):
-        self.property = property
-
-    def __get__(self, instance, cls=None):
-        if instance is not None:
-            wkb = self.property.__get__(instance, cls)
-            if wkb is None:
-                return None
-            p = to_shape(wkb)
-            p.to_wkb = lambda: wkb
-            return p
 
-        elif cls is not None:
-            return self.property.__get__(instance, cls)
+class MultiPolygonGeometryDescriptor(GeometryDescriptor):
+    """descriptor for 2D multipolygon geometry"""
 
     def __set__(self, instance, v):
-        if isinstance(v, MultiPolygon):
-            # TODO: read SRID from column and copy
-            self.property.__set__(instance, from_shape(v, srid=4326))
+        if v is None:
+            self.property.__set__(instance, None)
+        elif isinstance(v, MultiPolygon):
+            self.set_shape(instance, v)
         elif isinstance(v, Polygon):
-            # TODO: read SRID from column and copy
-            mp = MultiPolygon(*[v.poly.boundary.coords])
-            self.property.__set__(instance, from_shape(mp, srid=4326))
-        else:
+            self.set_shape(instance, MultiPolygon([v]))
+        elif not self.set_encoded(instance, v):
             if isinstance(v[-1], Sequence):
                 points = v
                 srid = None
             else:
                 points = v[:-1]
                 srid = v[-1]
-            p = MultiPolygon(*points)
-            self.property.__set__(instance, from_shape(p, srid=srid))
+            self.set_shape(instance, MultiPolygon(*points), srid)
+
+
+try:
+    _buffer = buffer
+    _binary_types = (bytes, bytearray, buffer, memoryview)
+except NameError:
+    _buffer = memoryview
+    _binary_types = (bytes, bytearray, memoryview)
+
+# little-endian 2D point WKB: byte order, geometry type, x, y
+_point_wkb = struct.Struct('<BIdd')
+
+
+class SpatialIndex(object):
+    """in-memory STR-tree over the geometry `column` of a set of Geometric
+    instances, answering bbox, intersects, within and nearest queries with
+    the instances themselves.
+
+    The tree cannot be modified once built, so instances added after it are
+    kept aside and checked one by one, and removed ones are skipped; the
+    tree is rebuilt once more than `rebuild_threshold` changes accumulate.
+    `bounds` covers every indexed geometry; it grows as instances are added,
+    and only shrinks back when the tree is rebuilt.
+    """
+
+    def __init__(self, column, rows=(), rebuild_threshold=256):
+        self.column = column
+        self.rebuild_threshold = rebuild_threshold
+        self.instances = []
+        self.geometries = []
+        self.positions = {}
+        self.pending = []
+        self.removed = set()
+        self.tree = None
+        self.tree_ids = {}
+        self.bounds = None
+        for instance in rows:
+            self._append(instance)
+        self.rebuild()
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, instance):
+        return id(instance) in self.positions
+
+    def add(self, instance):
+        """indexes `instance`, or re-indexes it if its geometry changed"""
+        self._append(instance)
+        self._maybe_rebuild()
+
+    def _append(self, instance):
+        position = self.positions.pop(id(instance), None)
+        if position is not None:
+            self.removed.add(position)
+
+        geometry = getattr(instance, self.column)
+        if geometry is not None:
+            self.positions[id(instance)] = len(self.instances)
+            self.instances.append(instance)
+            self.geometries.append(geometry)
+            self.pending.append(len(self.instances) - 1)
+            if self.bounds is None:
+                self.bounds = geometry.bounds
+            else:
+                self.bounds = _total_bounds([self.bounds, geometry.bounds])
+
+    update = add
+
+    def remove(self, instance):
+        position = self.positions.pop(id(instance), None)
+        if position is not None:
+            self.removed.add(position)
+            self._maybe_rebuild()
+
+    def _maybe_rebuild(self):
+        if len(self.pending) + len(self.removed) > self.rebuild_threshold:
+            self.rebuild()
+
+    def rebuild(self):
+        """packs the live entries into a new tree"""
+        live = sorted(self.positions.values())
+        self.instances = [self.instances[i] for i in live]
+        self.geometries = [self.geometries[i] for i in live]
+        self.positions = dict((id(m), i) for i, m in enumerate(self.instances))
+        self.pending = []
+        self.removed = set()
+        self.tree = STRtree(self.geometries) if self.geometries else None
+        self.tree_ids = dict((id(g), i) for i, g in enumerate(self.geometries))
+        self.bounds = _total_bounds([g.bounds for g in self.geometries]) \
+            if self.geometries else None
+
+    def _candidates(self, geometry):
+        """positions of the live entries whose envelope meets that of
+        `geometry`"""
+        if self.tree is not None:
+            hits = self.tree.query(geometry)
+            if len(hits) and isinstance(hits[0], BaseGeometry):
+                # shapely < 2 returns the geometries themselves
+                hits = [self.tree_ids[id(g)] for g in hits]
+            for i in hits:
+                if i not in self.removed:
+                    yield int(i)
+
+        bounds = geometry.bounds
+        for i in self.pending:
+            if i not in self.removed and _envelopes_meet(self.geometries[i].bounds, bounds):
+                yield i
+
+    def _matching(self, geometry, predicate):
+        return [self.instances[i] for i in self._candidates(geometry)
+                if predicate(self.geometries[i], geometry)]
+
+    def bbox(self, minx, miny, maxx, maxy):
+        """instances whose geometry intersects the given rectangle"""
+        return self.intersects(box(minx, miny, maxx, maxy))
+
+    def intersects(self, geometry):
+        return self._matching(geometry, BaseGeometry.intersects)
+
+    def within(self, geometry):
+        """instances whose geometry lies within `geometry`"""
+        return self._matching(geometry, BaseGeometry.within)
+
+    def nearest(self, geometry, k=1):
+        """the `k` instances nearest to `geometry`, closest first.
+
+        Searches an envelope around `geometry` which doubles in size until
+        it holds `k` entries no farther away than its half-width."""
+        count = len(self)
+        if not count:
+            return []
+        k = min(k, count)
+
+        minx, miny, maxx, maxy = self.bounds
+        extent = max(maxx - minx, maxy - miny)
+        reach = max(extent * math.sqrt(float(k) / count), 1e-9)
+        limit = extent + geometry.distance(box(minx, miny, maxx, maxy))
+
+        x0, y0, x1, y1 = geometry.bounds
+        while True:
+            envelope = box(x0 - reach, y0 - reach, x1 + reach, y1 + reach)
+            found = [(self.geometries[i].distance(geometry), i)
+                     for i in self._candidates(envelope)]
+            close = sorted(f for f in found if f[0] <= reach)
+            if len(close) >= k or reach > limit:
+                return [self.instances[i] for d, i in sorted(found)[:k]]
+            reach *= 2
+
+
+def _envelopes_meet(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _total_bounds(bounds):
+    return (min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds))
 
 
 def Point_repr(point):
@@ -1,5 +1,7 @@
+from binascii import hexlify
 from hashlib import sha1
-from uuid import uuid4 as uuid
+import os
+import time
 import warnings
 
 from sqlalchemy.ext.hybrid import hybrid_property
@@ -11,6 +13,38 @@ from batteries.model import Model
 from batteries.model.types import Ascii
 
 
+def random_key():
+    """160 random bits as 40 hex digits"""
+    return unicode(hexlify(os.urandom(20)))
+
+
+def time_key():
+    """microseconds since the epoch as 14 hex digits followed by 104 random
+    bits as 26 hex digits; keys sort by creation time, so inserts append to
+    the right edge of the primary key index"""
+    return u'{0:014x}{1}'.format(int(time.time() * 1000000),
+                                 hexlify(os.urandom(13)))
+
+
+def content_key(values):
+    """SHA-1 hex digest of `values`, for keys derived from instance content"""
+    h = sha1()
+    for v in values:
+        if isinstance(v, unicode):
+            v = v.encode('utf-8')
+        h.update(str(v))
+    return unicode(h.hexdigest())
+
+
+# strategies for string values of `Hashable.keyed_on`; a tuple of attribute
+# names selects `content_key` instead
+key_strategies = {
+    'uuid': random_key,
+    'random': random_key,
+    'time': time_key,
+}
+
+
 class Hashable(object):
     key_name = 'key'
     keyed_on = 'uuid'
@@ -18,28 +52,30 @@ class Hashable(object):
     @classmethod
     def make_key(cls, instance=None, **values):
         if instance is not None:
-            h = sha1()
-
-            if isinstance(instance.keyed_on, tuple):
-                for p in instance.keyed_on:
-                    h.update(str(getattr(instance, p)))
-
-            elif instance.keyed_on == 'uuid':
-                h.update(uuid().hex)
-
-            return unicode(h.hexdigest())
+            keyed_on = instance.keyed_on
+            if isinstance(keyed_on, tuple):
+                return content_key(getattr(instance, p) for p in keyed_on)
 
         else:
-            h = sha1()
+            keyed_on = cls.keyed_on
+            if isinstance(keyed_on, tuple):
+                return content_key(values[p] for p in keyed_on)
 
-            if isinstance(cls.keyed_on, tuple):
-                for p in cls.keyed_on:
-                    h.update(values[p])
+        try:
+            strategy = key_strategies[keyed_on]
+        except KeyError:
+            raise ValueError("{0}.keyed_on: unknown key strategy {1!r}".format(
+                cls.__name__, keyed_on))
+        return strategy()
 
-            elif cls.keyed_on == 'uuid':
-                h.update(uuid().hex)
-
-            return unicode(h.hexdigest())
+    @classmethod
+    def on_bulk_insert(cls, rows, context=None):
+        colname = _get_key_name(cls)
+        for row in rows:
+            if cls.key_name in row:
+                row[colname] = row.pop(cls.key_name)
+            if row.get(colname) is None:
+                row[colname] = cls.make_key(**row)
 
     def update_key(self):
         colname = '_' + self.key_name
@@ -62,7 +98,7 @@ def _get_key_column(cls):
 def key_fget(instance):
     colname = _get_key_name(instance.__class__)
     if getattr(instance, colname) is None:
-        setattr(instance, colname, instance.make_key())
+        setattr(instance, colname, instance.make_key(instance))
     return getattr(instance, colname)
 
 
@@ -79,6 +115,8 @@ def key_expr(cls):
 @event.listens_for(Hashable, 'instrument_class', propagate=True)
 def instrument_class(mapper, cls):
     prop = hybrid_property(key_fget, key_fset, expr=key_expr)
+    # stored keys are never NULL, so the column can be read in its place
+    prop.column_alias = True
     setattr(cls, cls.key_name, prop)
     return object.__new__(cls)
 
@@ -90,7 +128,9 @@ def on_before_insert(mapper, connection, target):
 
 @event.listens_for(Hashable, 'before_update', propagate=True)
 def on_before_update(mapper, connection, target):
-    target.update_key()
+    # persistent rows almost always have a key; avoid the attribute machinery
+    if target.__dict__.get(_get_key_name(target.__class__)) is None:
+        target.update_key()
 
 
 def HashableAssociation(left_table, right_table, left_key_name=None, right_key_name=None, left_foreign_key_name='key', right_foreign_key_name='key', name=None, **kwargs):
@@ -4,7 +4,8 @@ from batteries.util import slugify
 
 from sqlalchemy import event
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.orm.attributes import instance_state
+from sqlalchemy.orm.session import Session
 
 
 class Identifiable(object):
@@ -30,6 +31,34 @@ class Identifiable(object):
         seed = slugify(u'-'.join(values))
         return seed[:col.type.length]
 
+    @classmethod
+    def on_bulk_insert(cls, rows, context=None):
+        colname = _get_slug_name(cls)
+        if context is None:
+            context = {}
+        if 'slug_allocator' not in context:
+            context['slug_allocator'] = SlugAllocator(cls.query.session)
+        allocator = context['slug_allocator']
+        pending = []
+
+        for row in rows:
+            if cls.slug_name in row:
+                row[colname] = row.pop(cls.slug_name)
+            if row.get(colname) is None:
+                pending.append(row)
+            else:
+                allocator.reserve(cls, row[colname])
+
+        for row in pending:
+            values = []
+            for key in cls.named_with:
+                if row.get(key) is None:
+                    raise ValueError(
+                            "{}.{} cannot be None and provide slug input".\
+                            format(cls.__name__, key))
+                values.append(row[key])
+            row[colname] = allocator.allocate(cls, cls.make_slug(None, *values))
+
     def update_slug(self):
         colname = _get_slug_name(self.__class__)
         if getattr(self, colname) is None:
@@ -49,24 +78,116 @@ def _get_slug_column(cls):
     return getattr(_get_slug_attr(cls).parent.columns, _get_slug_name(cls))
 
 
-def find_available_slug(cls, root, tries=100):
-    s = root
+def _escape_like(s):
+    return s.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _candidate_slugs(root, length, tries):
+    yield root[:length]
     for i in range(1, tries):
-        try:
-            attr = _get_slug_attr(cls)
-            col = _get_slug_column(cls)
-            length = col.type.length
+        suffix = "-{0}".format(i)
+        yield root[:length - len(suffix)] + suffix
+
 
-            cls.query.filter(attr == s).one()
-            suffix = "-{0}".format(i)
-            s = root[:length - len(suffix)] + suffix
-            s = s[:length]
-        except NoResultFound:
+def _slug_prefix(root, length, tries):
+    """the longest prefix shared by every candidate produced for `root`"""
+    suffix = "-{0}".format(tries - 1)
+    return root[:max(length - len(suffix), 0)]
+
+
+def find_taken_slugs(cls, prefix, query=None):
+    """returns the set of existing slugs of `cls` which begin with `prefix`,
+    fetched in a single query"""
+    attr = _get_slug_attr(cls)
+    if query is None:
+        query = cls.query
+    query = query.with_entities(attr).\
+            filter(attr.like(_escape_like(prefix) + u'%', escape='\\'))
+    return set(s for (s,) in query)
+
+
+def find_available_slug(cls, root, tries=100, taken=None, query=None):
+    """returns the first free slug among `root`, `root-1`, `root-2`, ...
+
+    Existing slugs sharing the root are fetched in one query unless `taken` is
+    given; the chosen slug is added to `taken`, which reserves it against
+    subsequent calls sharing the same set."""
+    length = _get_slug_column(cls).type.length
+    if taken is None:
+        taken = find_taken_slugs(cls, _slug_prefix(root, length, tries), query)
+
+    for s in _candidate_slugs(root, length, tries):
+        if s not in taken:
+            taken.add(s)
             return s
 
     raise Exception(
-        "{cls.__name__} exceeded 100 iterations searching for available slug on input: {0!r}".format(
-            seeds, cls=cls))
+        "{cls.__name__} exceeded {1} iterations searching for available slug on input: {0!r}".format(
+            root, tries, cls=cls))
+
+
+class _TakenSlugs(object):
+    """the union of `fetched` and `reserved` slugs, without copying either;
+    slugs added are reserved"""
+
+    def __init__(self, fetched, reserved):
+        self.fetched = fetched
+        self.reserved = reserved
+
+    def __contains__(self, slug):
+        return slug in self.fetched or slug in self.reserved
+
+    def add(self, slug):
+        self.reserved.add(slug)
+
+
+class SlugAllocator(object):
+    """allocates slugs for a batch of rows.
+
+    One query is issued per distinct table and root, and slugs are reserved
+    as they are allocated, so that rows sharing a root within the batch
+    receive distinct suffixes."""
+
+    def __init__(self, session=None, tries=100):
+        self.session = session
+        self.tries = tries
+        self.fetched = {}
+        self.reserved = {}
+
+    def reserve(self, cls, slug):
+        self.reserved.setdefault(_get_slug_column(cls).table, set()).add(slug)
+
+    def allocate(self, cls, root):
+        col = _get_slug_column(cls)
+        prefix = _slug_prefix(root, col.type.length, self.tries)
+
+        if (col.table, prefix) not in self.fetched:
+            query = self.session.query(cls) if self.session is not None else None
+            self.fetched[col.table, prefix] = find_taken_slugs(cls, prefix, query)
+
+        taken = _TakenSlugs(self.fetched[col.table, prefix],
+                            self.reserved.setdefault(col.table, set()))
+        return find_available_slug(cls, root, self.tries, taken=taken)
+
+
+def allocate_slugs(instances, session=None, tries=100):
+    """assigns a slug to each of `instances` which lacks one, using a single
+    :class:`SlugAllocator`"""
+    allocator = SlugAllocator(session, tries)
+    pending = []
+
+    for instance in instances:
+        cls = instance.__class__
+        slug = getattr(instance, _get_slug_name(cls))
+        if slug is None:
+            pending.append(instance)
+        else:
+            allocator.reserve(cls, slug)
+
+    for instance in pending:
+        cls = instance.__class__
+        slug = allocator.allocate(cls, Identifiable.make_slug(instance))
+        setattr(instance, _get_slug_name(cls), slug)
 
 
 def slug_fget(instance):
@@ -96,3 +217,11 @@ def instrument_class(mapper, cls):
 @event.listens_for(Identifiable, 'before_insert', propagate=True)
 def on_before_insert(mapper, connection, target):
     target.update_slug()
+
+
+@event.listens_for(Session, 'before_flush')
+def on_session_before_flush(session, flush_context, instances):
+    new = [o for o in session.new if isinstance(o, Identifiable)]
+    if new:
+        new.sort(key=lambda o: instance_state(o).insert_order)
+        allocate_slugs(new, session)
@@ -27,6 +27,12 @@ class Loggable(object):
         self.log_messages.append(m)
         return m
 
+    @classmethod
+    def on_bulk_insert(cls, rows, context=None):
+        if cls.logging_required and rows:
+            raise Exception("Attempting to bulk insert {0!r} instances without "
+                            "log messages".format(cls.__name__))
+
     def debug(self, qualifier, message, data=None):
         return self.log('debug', qualifier, message, data)
 
@@ -15,6 +15,13 @@ class Recordable(object):
     ctime._creation_order = sys.maxsize - 1
     mtime._creation_order = sys.maxsize
 
+    @classmethod
+    def on_bulk_insert(cls, rows, context=None):
+        now = datetime.utcnow().replace(tzinfo=tzutc())
+        for row in rows:
+            row['ctime'] = now
+            row['mtime'] = now
+
 
 @event.listens_for(Recordable.ctime, 'before_parent_attach', propagate=True)
 def on_ctime_before_parent_attach(column, table):
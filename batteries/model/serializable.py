@@ -1,8 +1,16 @@
 import collections
+import json
 import numbers
-from sqlalchemy.orm import object_session
+from itertools import islice
+from operator import attrgetter
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import object_session, class_mapper, ColumnProperty
+from sqlalchemy.orm.attributes import InstrumentedAttribute, QueryableAttribute
+from sqlalchemy.orm.query import Query
 from sqlalchemy.orm.util import has_identity 
 
+from batteries.cache import LRUCache
+
 class Serializer(object):
     datetime_format = '%s'
     date_format = '%Y-%m%d'
@@ -45,6 +53,171 @@ def serialize(v, serializers, opts):
 
     raise ValueError("No serialization available for {!r}".format(v))
 
+# keyed on the field selection, which may come from clients, so bounded
+_plans = LRUCache(1024)
+
+def _identity(v):
+    return v
+
+def _none(v):
+    return None
+
+def _column_attribute(cls, prop):
+    """returns the attribute of the single mapped column which `prop` reads,
+    if `prop` is a plain column or a hybrid property marked with
+    ``column_alias = True``, whose getter returns its column's value for any
+    row read from the database"""
+    for c in cls.__mro__:
+        if prop in c.__dict__:
+            descriptor = c.__dict__[prop]
+            break
+    else:
+        return None
+
+    if isinstance(descriptor, hybrid_property):
+        if not getattr(descriptor, 'column_alias', False):
+            return None
+        attr = getattr(cls, prop)
+    elif isinstance(descriptor, InstrumentedAttribute):
+        attr = descriptor
+    else:
+        return None
+
+    if isinstance(attr, QueryableAttribute) and \
+            isinstance(attr.property, ColumnProperty) and \
+            len(attr.property.columns) == 1:
+        return attr
+
+class SerializationPlan(object):
+    """the fields, accessors and per-type converters needed to serialize
+    instances of a class, computed once and reused for every instance"""
+
+    def __init__(self, cls, fields):
+        self.serializers = cls.__serializable_args__['serializers']
+        self.opts = cls.__serializable_args__['opts']
+        self.cls = cls
+        self.methods = []
+        self.attributes = []
+        self.converters = {}
+        self._columns = False
+
+        for prop in fields:
+            name = 'serialize_' + prop
+            if getattr(cls, name, None) is not None:
+                # looked up on each instance, so that static and class
+                # methods are called as they would be on the instance
+                self.methods.append((prop, attrgetter(name)))
+            else:
+                self.attributes.append((prop, attrgetter(prop)))
+
+        self.methods = tuple(self.methods)
+        self.attributes = tuple(self.attributes)
+
+    def converter(self, t):
+        try:
+            return self.converters[t]
+        except KeyError:
+            pass
+
+        if t.__name__ in self.serializers:
+            f, opts = self.serializers[t.__name__], self.opts
+            c = lambda v: f(v, opts)
+        elif t is type(None):
+            c = _none
+        elif issubclass(t, (basestring, numbers.Number)):
+            c = _identity
+        elif hasattr(t, 'serialize'):
+            c = lambda v: v.serialize()
+        elif issubclass(t, (collections.Sequence, collections.Set)):
+            c = lambda v: [self.convert(w) for w in v]
+        elif issubclass(t, collections.Mapping):
+            c = lambda v: {k: self.convert(w) for k, w in v.items()}
+        else:
+            c = lambda v: serialize(v, self.serializers, self.opts)
+
+        self.converters[t] = c
+        return c
+
+    def convert(self, v):
+        return self.converter(type(v))(v)
+
+    @property
+    def columns(self):
+        """the column attributes to select in place of instances, or None
+        if a field needs a ``serialize_<prop>`` method or is not a column"""
+        if self._columns is False:
+            self._columns = None
+            if not self.methods and \
+                    class_mapper(self.cls).polymorphic_on is None:
+                columns = [_column_attribute(self.cls, prop)
+                           for prop, get in self.attributes]
+                if all(c is not None for c in columns):
+                    self._columns = tuple(columns)
+        return self._columns
+
+    def serialize_row(self, row):
+        """serializes a row selected from :attr:`columns`"""
+        obj = {}
+        converters = self.converters
+        for (prop, get), v in zip(self.attributes, row):
+            c = converters.get(type(v)) or self.converter(type(v))
+            obj[prop] = c(v)
+        return obj
+
+    def __call__(self, instance):
+        obj = {}
+        for prop, method in self.methods:
+            obj[prop] = method(instance)()
+
+        converters = self.converters
+        if object_session(instance) is None and not has_identity(instance):
+            # transient instances are not tied to a session,
+            # so we can't call getattr() because that can cause an attribute refresh,
+            # which is a hard SQLAlchemy error
+            d = instance.__dict__
+            for prop, get in self.attributes:
+                v = d.get(prop)
+                c = converters.get(type(v)) or self.converter(type(v))
+                obj[prop] = c(v)
+        else:
+            for prop, get in self.attributes:
+                v = get(instance)
+                c = converters.get(type(v)) or self.converter(type(v))
+                obj[prop] = c(v)
+
+        return obj
+
+def _freeze(v):
+    if v is None or isinstance(v, basestring):
+        return v
+    return tuple(v)
+
+def serialization_plan(cls, fields=None, include=None, exclude=None):
+    """returns the cached :class:`SerializationPlan` for `cls` and the given
+    field selection, compiling it on first use"""
+    # frozen once, so that iterators are not consumed by the key alone
+    fields, include, exclude = _freeze(fields), _freeze(include), _freeze(exclude)
+    key = (cls, fields, include, exclude)
+    plan = _plans.get(key)
+    if plan is not None:
+        return plan
+
+    if fields is None:
+        fields = set(cls.serializable)
+
+        if include is not None:
+            fields |= set(include)
+
+        if exclude is not None:
+            fields ^= set(exclude)
+
+    plan = SerializationPlan(cls, fields)
+    _plans.set(key, plan)
+    return plan
+
+def invalidate_serialization_plans():
+    _plans.clear()
+
 class Serializable(object):
     __serializable_args__ = {
         'opts': {
@@ -61,41 +234,89 @@ class Serializable(object):
     @classmethod
     def define_serializer(cls, target_cls, serializer):
         if isinstance(target_cls, type):
-            target_cls == target_cls.__name__
-        self.__serializable_args__['serializers'][target] = serializer
+            target_cls = target_cls.__name__
+        cls.__serializable_args__['serializers'][target_cls] = serializer
+        invalidate_serialization_plans()
 
     @classmethod
     def set_serializer_option(cls, name, value):
-        self.__serializable_args__['opts'][name] = value
+        cls.__serializable_args__['opts'][name] = value
+        invalidate_serialization_plans()
 
     def serialize(self, fields=None, include=None, exclude=None):
-        obj = {}
+        return serialization_plan(self.__class__, fields, include, exclude)(self)
 
-        if fields is None:
-            fields = set(self.__class__.serializable)
+    @classmethod
+    def serialize_query(cls, query, fields=None, include=None, exclude=None,
+                        chunk_size=None):
+        """serializes the instances of `cls` selected by `query`, yielding
+        one dict per row.
 
-            if include is not None:
-                fields |= set(include)
+        When every field is a mapped column (or a hybrid property marked as
+        aliasing one), only those columns are selected and instances are never
+        constructed, bypassing the identity map and load events; otherwise
+        the instances are loaded and serialized as usual. Either way the
+        output matches :meth:`serialize`.
+        """
+        plan = serialization_plan(cls, fields, include, exclude)
+        columns = plan.columns
+        if columns is not None:
+            query = query.with_entities(*columns)
+            if chunk_size:
+                query = query.yield_per(chunk_size)
+            return (plan.serialize_row(row) for row in query)
 
-            if exclude is not None:
-                fields ^= set(exclude)
+        if chunk_size:
+            query = query.yield_per(chunk_size)
+        return _serialize_instances(query, fields, include, exclude)
 
-        for prop in fields:
-            serializer_name = 'serialize_' + prop
-            if hasattr(self, serializer_name):
-                obj[prop] = getattr(self, serializer_name)()
+    @classmethod
+    def serialize_many(cls, instances, fields=None, include=None, exclude=None,
+                       chunk_size=1000, lines=False, encoder=None, columns=False):
+        """serializes `instances`, a query or any iterable of instances, and
+        yields encoded JSON text incrementally, one chunk of `chunk_size`
+        instances at a time.
 
+        The concatenated output is a JSON array, or newline-delimited JSON
+        documents if `lines` is true. Queries are fetched with
+        ``yield_per(chunk_size)`` so that rows are loaded as they are
+        consumed; eager loading of collections is not compatible with this.
+        If `columns` is true, queries are serialized through
+        :meth:`serialize_query`.
+        """
+        if isinstance(instances, Query):
+            if columns:
+                objs = cls.serialize_query(instances, fields, include, exclude,
+                                           chunk_size)
             else:
-                is_transient = object_session(self) is None and not has_identity(self)
-                if is_transient:
-                    # transiet instances are not tied to a session,
-                    # so we can't call getattr() because that can cause an attribute refresh,
-                    # which is a hard SQLAlchemy error
-                    v = self.__dict__.get(prop)
-                else:
-                    v = getattr(self, prop)
-                serializers = self.__serializable_args__['serializers']
-                opts = self.__serializable_args__['opts']
-                obj[prop] = serialize(v, serializers, opts)
+                objs = _serialize_instances(instances.yield_per(chunk_size),
+                                            fields, include, exclude)
+        else:
+            objs = _serialize_instances(instances, fields, include, exclude)
 
-        return obj
+        encode = (encoder or json.JSONEncoder()).encode
+
+        def chunks():
+            while True:
+                chunk = [encode(obj) for obj in islice(objs, chunk_size)]
+                if not chunk:
+                    return
+                yield chunk
+
+        if lines:
+            for chunk in chunks():
+                yield u'\n'.join(chunk) + u'\n'
+        else:
+            sep = u'['
+            for chunk in chunks():
+                yield sep + u','.join(chunk)
+                sep = u','
+            yield u']' if sep == u',' else u'[]'
+
+def _serialize_instances(instances, fields=None, include=None, exclude=None):
+    plans = {}
+    for o in instances:
+        t = type(o)
+        if t not in plans:
+            plans[t] = serialization_plan(t, fields, include, exclude)
+        yield plans[t](o)
@@ -1,13 +1,187 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from hashlib import md5, sha256
+import errno
+import fcntl
+import io
+import logging
+import mmap
 import os
+import shutil
+import tempfile
+import threading
+import time
 
 from sqlalchemy.ext.mutable import Mutable
+from sqlalchemy.orm import object_session
 from sqlalchemy.orm.interfaces import MapperExtension, EXT_CONTINUE, EXT_STOP
+from sqlalchemy.orm.session import Session
 from sqlalchemy.types import TypeDecorator, String
 from sqlalchemy import event
 
 from batteries.path import AssetResolver
 
+logger = logging.getLogger('batteries.model.storable')
+
+# relative pathspecs resolve against batteries.model, as they always have
+_resolver = AssetResolver(__name__)
+_base_paths = {}
+
+
+def resolve_base_path(pathspec):
+    """the absolute directory named by `pathspec`, memoized so that the
+    asset resolver is consulted once per pathspec"""
+    try:
+        return _base_paths[pathspec]
+    except KeyError:
+        path = _base_paths[pathspec] = _resolver.resolve(pathspec).abspath()
+        return path
+
+storage_workers = 4
+async_storage_workers = 8
+cleanup_batch_size = 1000
+_executor = None
+_async_executor = None
+
+
+def storage_executor():
+    """the executor shared by background storage work, created on first use
+    with :data:`storage_workers` threads"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=storage_workers)
+    return _executor
+
+
+def set_storage_executor(executor):
+    global _executor
+    _executor = executor
+
+
+def async_storage_executor():
+    """the executor which runs the blocking side of the asynchronous proxy
+    methods, created on first use with :data:`async_storage_workers`
+    threads; kept apart from :func:`storage_executor` so that the two can
+    wait on each other"""
+    global _async_executor
+    if _async_executor is None:
+        _async_executor = ThreadPoolExecutor(max_workers=async_storage_workers)
+    return _async_executor
+
+
+def set_async_storage_executor(executor):
+    global _async_executor
+    _async_executor = executor
+
+
+def _event_loop():
+    import asyncio
+    try:
+        return asyncio.get_running_loop()
+    except (AttributeError, RuntimeError):
+        return asyncio.get_event_loop()
+
+
+class AsyncChunkIterator(object):
+    """asynchronous iterator over the chunks of a :class:`LocalFileProxy`"""
+
+    def __init__(self, proxy, size=None):
+        self.proxy = proxy
+        self.size = size or proxy.buffer_size
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self.proxy._run_async(self._next)
+
+    def _next(self):
+        chunk = self.proxy.read(self.size)
+        if not chunk:
+            raise StopAsyncIteration
+        return chunk
+
+
+class SerialQueue(object):
+    """runs callables on a shared executor one at a time, in the order they
+    were submitted, without tying up a worker while idle"""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self.lock = threading.Lock()
+        self.tasks = deque()
+        self.running = False
+        self.last = None
+        self.error = None
+
+    def submit(self, fn, *args):
+        future = Future()
+        with self.lock:
+            self.tasks.append((future, fn, args))
+            self.last = future
+            if not self.running:
+                self.running = True
+                self.executor.submit(self._drain)
+        return future
+
+    def _drain(self):
+        while True:
+            with self.lock:
+                if not self.tasks:
+                    self.running = False
+                    return
+                future, fn, args = self.tasks.popleft()
+
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+                with self.lock:
+                    if self.error is None:
+                        self.error = e
+
+    def join(self):
+        """waits for every submitted callable, then raises the first error
+        raised by any of them since the last join"""
+        if self.last is not None:
+            wait([self.last])
+        with self.lock:
+            error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+
+def remove_files(paths, retries=3, delay=0.5):
+    """unlinks each of `paths`, ignoring files which are already gone and
+    retrying the rest up to `retries` times with exponential backoff"""
+    for attempt in range(retries + 1):
+        failed = []
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    failed.append(path)
+
+        if not failed:
+            return
+        paths = failed
+        if attempt < retries:
+            time.sleep(delay * 2 ** attempt)
+
+    logger.error("could not remove {0} files, including {1!r}".format(
+        len(paths), paths[0]))
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.error("background storage operation failed: {0!r}".format(
+            future.exception()))
+
 class FileProxy(object):
+    buffer_size = 64 * 1024
+
     def __init__(self, path, filename='', file=None):
         self.path = path
         self.file = file
@@ -15,7 +189,8 @@ class FileProxy(object):
         self.dirty = False
 
     def close(self):
-        self.file.close()
+        if self.file is not None:
+            self.file.close()
         self.file = None
         self.dirty = False
 
@@ -23,19 +198,28 @@ class FileProxy(object):
         self.file.flush()
         self.dirty = False
 
+    def wait(self):
+        """blocks until pending background writes are complete"""
+        pass
+
     def read(self, size=-1):
+        self.wait()
         return self.file.read(size)
 
     def readline(self, size=-1):
+        self.wait()
         return self.file.readline(size)
 
     def readlines(self, sizehint=None):
+        self.wait()
         return self.file.readlines(sizehint)
 
     def seek(self, offset, whence=os.SEEK_SET):
+        self.wait()
         return self.file.seek(offset, whence)
 
     def tell(self):
+        self.wait()
         return self.file.tell()
 
     def write(self, s):
@@ -46,9 +230,144 @@ class FileProxy(object):
         self.dirty = True
         return self.file.writelines(seq)
 
+    def iter_chunks(self, size=None):
+        """yields the remaining contents of the file in chunks of at most
+        `size` bytes (default :attr:`buffer_size`)"""
+        self.wait()
+        size = size or self.buffer_size
+        while True:
+            chunk = self.file.read(size)
+            if not chunk:
+                return
+            yield chunk
+
+    def copy_from(self, source, buffer_size=None):
+        """copies the remaining contents of the file-like `source` into this
+        file without holding more than `buffer_size` bytes in memory; when
+        both are backed by file descriptors, ``os.sendfile`` copies within
+        the kernel instead"""
+        self.dirty = True
+        if not _sendfile(source, self.file):
+            shutil.copyfileobj(source, self.file, buffer_size or self.buffer_size)
+
+
+def _makedirs(directory):
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def fanout_path(filename, fanout, key=None):
+    """prefixes `filename` with one directory level per width in `fanout`,
+    taken from the hex digest `key` (by default, the MD5 of `filename`)"""
+    if not fanout:
+        return filename
+    if key is None:
+        name = filename.encode('utf-8') if isinstance(filename, unicode) else filename
+        key = md5(name).hexdigest()
+
+    parts, i = [], 0
+    for width in fanout:
+        parts.append(key[i:i + width])
+        i += width
+    parts.append(filename)
+    return os.path.join(*parts)
+
+
+def reshard(pathspec, fanout, workers=8):
+    """moves the files stored directly under `pathspec` into the directory
+    layout given by `fanout`, using `workers` threads; returns the number
+    of files moved"""
+    base = resolve_base_path(pathspec)
+    names = [n for n in os.listdir(base) if not n.startswith('.') and
+             os.path.isfile(os.path.join(base, n))]
+
+    def move(name):
+        target = os.path.join(base, fanout_path(name, fanout))
+        _makedirs(os.path.dirname(target))
+        os.rename(os.path.join(base, name), target)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for future in [executor.submit(move, name) for name in names]:
+            future.result()
+    finally:
+        executor.shutdown()
+    return len(names)
+
+
+def _fsync(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _fileno(f):
+    try:
+        return f.fileno()
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+def _sendfile(source, dest):
+    sendfile = getattr(os, 'sendfile', None)
+    infd, outfd = _fileno(source), _fileno(dest)
+    if sendfile is None or infd is None or outfd is None:
+        return False
+
+    try:
+        offset = start = source.tell()
+    except (IOError, OSError, io.UnsupportedOperation):
+        # not seekable, such as a pipe or a socket
+        return False
+
+    dest.flush()
+    while True:
+        try:
+            sent = sendfile(outfd, infd, offset, 1 << 30)
+        except OSError:
+            # nothing has been copied yet, so the caller can fall back
+            if offset == start:
+                return False
+            raise
+        if not sent:
+            break
+        offset += sent
+
+    source.seek(offset)
+    dest.seek(0, os.SEEK_END)
+    return True
+
 class LocalFileProxy(FileProxy):
-    def __init__(self, path, filename='', file=None):
-        self.resolver = AssetResolver()
+    """proxy for a file stored under a local directory.
+
+    With `atomic`, writes go to a temporary file next to the final path,
+    which :meth:`commit` renames into place and :meth:`discard` removes;
+    :class:`Storable` calls these when the session commits or rolls back.
+    `write_behind` implies `atomic` and additionally hands writes, flushes
+    and the final rename to :func:`storage_executor`, so that they do not
+    hold up the caller or the database transaction.
+
+    The ``a``-prefixed methods (:meth:`aread`, :meth:`awrite`, ...) return
+    asyncio futures for use from coroutines, and :meth:`aiter_chunks` can be
+    consumed with ``async for``.
+    """
+    resolver = _resolver
+    _mmap = None
+    temp_path = None
+    _queue = None
+    _async_queue = None
+
+    def __init__(self, path, filename='', file=None, atomic=False,
+                 write_behind=False, fanout=()):
+        self.atomic = atomic or write_behind
+        self.write_behind = write_behind
+        self.fanout = fanout
         super(LocalFileProxy, self).__init__(path, filename, file)
 
         if file is not None:
@@ -56,18 +375,157 @@ class LocalFileProxy(FileProxy):
                 self.file = file.file
             else:
                 self.open('w+')
-                self.write(file.read())
+                self.copy_from(file)
 
     @property
     def abspath(self):
         assert self.filename, "{0}.filename must be set before calling open()".format(self.__class__.__name__)
-        base = self.resolver.resolve(self.path).abspath()
-        return os.path.join(base, self.filename)
+        return os.path.join(resolve_base_path(self.path),
+                            fanout_path(self.filename, self.fanout))
 
     def open(self, mode='r'):
-        self.file = open(self.abspath, mode)
+        self.wait()
+        if self.fanout and self.filename and any(c in mode for c in 'wa+'):
+            _makedirs(os.path.dirname(self.abspath))
+
+        if self.atomic and any(c in mode for c in 'wa+') and self.temp_path is None:
+            fd, self.temp_path = tempfile.mkstemp(
+                prefix='.' + os.path.basename(self.filename or 'upload') + '.',
+                suffix='.tmp', dir=self.temp_dir())
+            os.close(fd)
+            if 'w' not in mode and self.filename and os.path.exists(self.abspath):
+                shutil.copyfile(self.abspath, self.temp_path)
+
+        self.file = open(self.temp_path or self.abspath, mode)
         return self
 
+    def temp_dir(self):
+        return os.path.dirname(self.abspath)
+
+    def close(self):
+        if self._mmap is not None:
+            # raises BufferError while views returned by view() are alive
+            self._mmap.close()
+            self._mmap = None
+
+        if self.write_behind and self.file is not None:
+            self._submit(self.file.close)
+            self.file = None
+            self.dirty = False
+        else:
+            super(LocalFileProxy, self).close()
+
+    def flush(self):
+        if self.write_behind:
+            self._submit(self.file.flush)
+            self.dirty = False
+        else:
+            super(LocalFileProxy, self).flush()
+
+    def write(self, s):
+        if self.write_behind:
+            self.dirty = True
+            self._submit(self.file.write, s)
+        else:
+            return super(LocalFileProxy, self).write(s)
+
+    def writelines(self, seq):
+        if self.write_behind:
+            self.dirty = True
+            self._submit(self.file.writelines, list(seq))
+        else:
+            return super(LocalFileProxy, self).writelines(seq)
+
+    def copy_from(self, source, buffer_size=None):
+        # the source belongs to the caller, so it is always read synchronously
+        self.wait()
+        super(LocalFileProxy, self).copy_from(source, buffer_size)
+
+    def _submit(self, fn, *args):
+        if self._queue is None:
+            self._queue = SerialQueue(storage_executor())
+        return self._queue.submit(fn, *args)
+
+    def wait(self):
+        if self._queue is not None:
+            self._queue.join()
+
+    def commit(self):
+        """moves the temporary file written in atomic mode into place"""
+        if self.write_behind:
+            self._submit(self._commit).add_done_callback(_log_failure)
+        else:
+            self._commit()
+
+    def _commit(self):
+        if self.temp_path is None:
+            return
+
+        if self._queue is not None and self._queue.error is not None:
+            # a background write failed, so the temporary file is incomplete
+            with self._queue.lock:
+                error, self._queue.error = self._queue.error, None
+            logger.error("discarding {0} after a failed background write: {1!r}".format(
+                self.temp_path, error))
+            self._discard()
+            return
+
+        if self.file is not None and not self.file.closed:
+            self.file.flush()
+        _fsync(self.temp_path)
+        os.rename(self.temp_path, self.abspath)
+        self.temp_path = None
+
+    def discard(self):
+        """removes the temporary file written in atomic mode, if any"""
+        if self.write_behind:
+            self._submit(self._discard).add_done_callback(_log_failure)
+        else:
+            self._discard()
+
+    def _discard(self):
+        if self.temp_path is None:
+            return
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.unlink(self.temp_path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+        self.temp_path = None
+        self.dirty = False
+
+    def mmap(self):
+        """returns a read-only memory map of the file, opening it for reading
+        if necessary; the map is closed along with the proxy"""
+        self.wait()
+        if self._mmap is None:
+            if self.file is None:
+                self.open('rb')
+            self.file.flush()
+            self._mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def view(self, offset=0, size=None):
+        """returns a zero-copy view of `size` bytes of the file starting at
+        `offset` (to the end of the file if `size` is None); views must be
+        released before the proxy is closed"""
+        if self.file is None:
+            self.open('rb')
+        if os.fstat(self.file.fileno()).st_size == 0:
+            return memoryview(b'')
+
+        m = self.mmap()
+        end = len(m) if size is None else offset + size
+        try:
+            return memoryview(m)[offset:end]
+        except TypeError:
+            # python 2 mmap objects only support the old buffer interface
+            return buffer(m, offset, end - offset)
+
     def remove(self):
         os.unlink(self.abspath)
 
@@ -78,21 +536,102 @@ class LocalFileProxy(FileProxy):
         self.close()
         return value is None
 
+    # awaitable counterparts of the blocking methods, run in order per proxy
+    # on async_storage_executor()
+
+    def _run_async(self, fn, *args):
+        import asyncio
+        if self._async_queue is None:
+            self._async_queue = SerialQueue(async_storage_executor())
+        loop = _event_loop()
+        return asyncio.wrap_future(self._async_queue.submit(fn, *args), loop=loop)
+
+    def aopen(self, mode='r'):
+        return self._run_async(self.open, mode)
+
+    def aread(self, size=-1):
+        return self._run_async(self.read, size)
+
+    def awrite(self, s):
+        return self._run_async(self.write, s)
+
+    def aflush(self):
+        return self._run_async(self.flush)
+
+    def aclose(self):
+        return self._run_async(self.close)
+
+    def acopy_from(self, source, buffer_size=None):
+        return self._run_async(self.copy_from, source, buffer_size)
+
+    def aremove(self):
+        return self._run_async(self.remove)
+
+    def aiter_chunks(self, size=None):
+        return AsyncChunkIterator(self, size)
+
+    def __aenter__(self):
+        future = _event_loop().create_future()
+        future.set_result(self)
+        return future
+
+    def __aexit__(self, type, value, tb):
+        return self.aclose()
+
 
 class LocalStorageType(TypeDecorator):
+    """column type for files stored under the directory named by `pathspec`;
+    the column holds the filename.
+
+    `fanout` spreads files over subdirectories, one level per width given,
+    named after a prefix of the MD5 of the filename; ``fanout=(2, 2)`` puts
+    ``a.png`` under ``ab/cd/`` (see :func:`reshard` to migrate files)."""
     impl = String
+    resolver = _resolver
+    fanout = ()
 
     def __init__(self, pathspec, *args, **kwargs):
-        self.resolver = AssetResolver()
         self.pathspec = pathspec
+        self.atomic = kwargs.pop('atomic', False)
+        self.write_behind = kwargs.pop('write_behind', False)
+        self.deferred_delete = kwargs.pop('deferred_delete', False)
+        self.fanout = tuple(kwargs.pop('fanout', self.fanout))
 
         TypeDecorator.__init__(self, *args, **kwargs)
 
+    def make_proxy(self, filename=''):
+        return MutableLocalFileProxy(self.pathspec, filename,
+                                     atomic=self.atomic,
+                                     write_behind=self.write_behind,
+                                     fanout=self.fanout)
+
     def process_bind_param(self, value, dialect=None):
         return value.filename
 
     def process_result_value(self, value, dialect=None):
-        return MutableLocalFileProxy(self.pathspec, filename=value)
+        return self.make_proxy(value)
+
+    def on_flush(self, proxy, session):
+        """called for `proxy` before its row is inserted or updated"""
+        if proxy.dirty:
+            proxy.flush()
+        log = transaction_log(session)
+        if proxy.temp_path is not None and log is not None:
+            # a proxy already pending in an enclosing transaction stays there
+            if not any(p is proxy for l in _transaction_logs(session).values()
+                       for p in l.get('pending', ())):
+                log.setdefault('pending', []).append(proxy)
+
+    def on_delete(self, proxy, session):
+        """called for `proxy` before its row is deleted"""
+        if not proxy.filename:
+            return
+        log = transaction_log(session)
+        if log is not None and self.deferred_delete:
+            # unlinked in the background once the deletion is committed
+            log.setdefault('deletes', []).append(proxy.abspath)
+        else:
+            proxy.remove()
 
 class MutableLocalFileProxy(Mutable, LocalFileProxy):
     @classmethod
@@ -110,17 +649,172 @@ class MutableLocalFileProxy(Mutable, LocalFileProxy):
         super(MutableLocalFileProxy, self).writelines(s)
         self.changed()
 
-LocalStorage = lambda *args: MutableLocalFileProxy.as_mutable(LocalStorageType(*args))
+    def copy_from(self, source, buffer_size=None):
+        super(MutableLocalFileProxy, self).copy_from(source, buffer_size)
+        self.changed()
+
+LocalStorage = lambda *args, **kwargs: MutableLocalFileProxy.as_mutable(LocalStorageType(*args, **kwargs))
+
+
+def digest_file(path, buffer_size=FileProxy.buffer_size):
+    h = sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(buffer_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+@contextmanager
+def _locked_refs(blob_path):
+    """exclusively locks the reference count file of `blob_path`, yielding
+    its descriptor; retries if the file is replaced while waiting"""
+    refs = blob_path + '.refs'
+    while True:
+        fd = os.open(refs, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_ino == os.stat(refs).st_ino:
+                break
+        except OSError:
+            pass
+        os.close(fd)
+
+    try:
+        yield fd
+    finally:
+        os.close(fd)
+
+
+def _update_refs(fd, delta):
+    os.lseek(fd, 0, os.SEEK_SET)
+    count = int(os.read(fd, 32) or 0) + delta
+    os.lseek(fd, 0, os.SEEK_SET)
+    os.ftruncate(fd, 0)
+    os.write(fd, str(count).encode('ascii'))
+    return count
+
+
+def acquire_blob(temp_path, blob_path):
+    """moves `temp_path` into place as `blob_path`, or discards it if the
+    blob already exists, and adds a reference to the blob"""
+    _makedirs(os.path.dirname(blob_path))
+    with _locked_refs(blob_path) as fd:
+        if os.path.exists(blob_path):
+            os.unlink(temp_path)
+        else:
+            _fsync(temp_path)
+            os.rename(temp_path, blob_path)
+        _update_refs(fd, 1)
+
+
+def release_blob(blob_path):
+    """drops a reference to `blob_path`, removing it with the last one"""
+    with _locked_refs(blob_path) as fd:
+        if _update_refs(fd, -1) <= 0:
+            for path in blob_path, blob_path + '.refs':
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+
+
+class ContentAddressedFileProxy(MutableLocalFileProxy):
+    """proxy for a file stored once per distinct content; `filename` is the
+    path of the blob relative to the storage directory, derived from the
+    SHA-256 of its contents"""
+
+    def __init__(self, path, filename='', file=None, fanout=(2, 2)):
+        super(ContentAddressedFileProxy, self).__init__(path, filename, file,
+                                                        atomic=True)
+        self.layout = fanout
+
+    def temp_dir(self):
+        return resolve_base_path(self.path)
+
+    def store(self):
+        """moves the written file into the store, returning the filename of
+        the blob it replaces"""
+        self.wait()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        digest = digest_file(self.temp_path)
+        filename = fanout_path(digest, self.layout, digest)
+        acquire_blob(self.temp_path, os.path.join(self.temp_dir(), filename))
+
+        self.temp_path = None
+        self.dirty = False
+        previous, self.filename = self.filename, filename
+        return previous
+
+    def remove(self):
+        release_blob(self.abspath)
+
+
+class ContentAddressedStorageType(LocalStorageType):
+    """stores each distinct file content once, under its hash; references
+    from rows are counted, and a blob is removed with its last reference.
+    The column holds the blob's path, including its `fanout` directories."""
+    fanout = (2, 2)
+
+    def make_proxy(self, filename=''):
+        return ContentAddressedFileProxy(self.pathspec, filename,
+                                         fanout=self.fanout)
+
+    def on_flush(self, proxy, session):
+        if proxy.temp_path is None:
+            return
+
+        previous = proxy.store()
+        base = resolve_base_path(self.pathspec)
+        log = transaction_log(session)
+        if log is None:
+            if previous:
+                release_blob(os.path.join(base, previous))
+            return
+
+        # references are released on commit, and acquired ones on rollback
+        log.setdefault('acquired', []).append(proxy.abspath)
+        if previous:
+            log.setdefault('released', []).append(os.path.join(base, previous))
+
+    def on_delete(self, proxy, session):
+        if not proxy.filename:
+            return
+        log = transaction_log(session)
+        if log is None:
+            proxy.remove()
+        else:
+            log.setdefault('released', []).append(proxy.abspath)
+
+ContentAddressedStorage = lambda *args, **kwargs: MutableLocalFileProxy.as_mutable(ContentAddressedStorageType(*args, **kwargs))
 
 class Storable(object):
+    _storage_fields = ()
+
     @property
     def storage_fields(self):
-        storage_fields = []
-        for k, v in self.__mapper__.columns.items():
-            if isinstance(v.type, LocalStorageType):
-                storage_fields.append(k)
+        return self._storage_fields
 
-        return storage_fields
+    @classmethod
+    def on_bulk_insert(cls, rows, context=None):
+        session = cls.query.session
+        for k in cls._storage_fields:
+            column = cls.__mapper__.columns[k].type
+            for row in rows:
+                proxy = row.get(k)
+                if proxy is None:
+                    continue
+                if not isinstance(proxy, LocalFileProxy):
+                    proxy = row[k] = column.make_proxy(proxy)
+                column.on_flush(proxy, session)
+
+@event.listens_for(Storable, 'mapper_configured', propagate=True)
+def configure_storable(mapper, cls):
+    cls._storage_fields = tuple(k for k, v in mapper.columns.items()
+                                if isinstance(v.type, LocalStorageType))
 
 @event.listens_for(Storable, 'init', propagate=True)
 def on_init(self, target, context):
@@ -128,19 +822,94 @@ def on_init(self, target, context):
 
     for f in self.storage_fields:
         column = self.__mapper__.columns[f].type
-        path = column.pathspec
         filename = getattr(self, f)
-        setattr(self, f, MutableLocalFileProxy(path, filename))
+        setattr(self, f, column.make_proxy(filename))
+
+def flush_storage_fields(target):
+    session = object_session(target)
+    for f in target.storage_fields:
+        column = target.__mapper__.columns[f]
+        column.type.on_flush(getattr(target, f), session)
 
 @event.listens_for(Storable, 'before_insert', propagate=True)
 def on_before_insert(mapper, connection, target):
-    for f in target.storage_fields:
-        proxy = getattr(target, f)
-        if proxy.dirty:
-            proxy.flush()
+    flush_storage_fields(target)
+
+@event.listens_for(Storable, 'before_update', propagate=True)
+def on_before_update(mapper, connection, target):
+    flush_storage_fields(target)
+
+def _transaction_scope(transaction):
+    """the root or SAVEPOINT transaction whose outcome `transaction` shares"""
+    while transaction._parent is not None and not transaction.nested:
+        transaction = transaction._parent
+    return transaction
+
+def _transaction_logs(session):
+    return session.info.setdefault('batteries.storable.transactions', {})
+
+def transaction_log(session):
+    """returns the dict of lists of storage work to do when the root or
+    SAVEPOINT transaction in progress in `session` commits or rolls back,
+    or None outside of a transaction"""
+    if session is None or session.transaction is None:
+        return None
+    return _transaction_logs(session).setdefault(
+        _transaction_scope(session.transaction), {})
+
+def commit_storage(log):
+    for proxy in log.get('pending', ()):
+        proxy.commit()
+
+    for path in log.get('released', ()):
+        release_blob(path)
+
+    paths = log.get('deletes')
+    if paths:
+        executor = storage_executor()
+        for i in range(0, len(paths), cleanup_batch_size):
+            batch = paths[i:i + cleanup_batch_size]
+            executor.submit(remove_files, batch).add_done_callback(_log_failure)
+
+def rollback_storage(log):
+    for proxy in log.get('pending', ()):
+        proxy.discard()
+
+    for path in log.get('acquired', ()):
+        release_blob(path)
+
+@event.listens_for(Session, 'after_commit')
+def on_session_after_commit(session):
+    # fired for the root transaction and for released SAVEPOINTs, while the
+    # transaction is still current
+    transaction = session.transaction
+    log = _transaction_logs(session).pop(transaction, None)
+    if log and transaction.nested:
+        parent = _transaction_logs(session).setdefault(
+            _transaction_scope(transaction._parent), {})
+        for k, v in log.items():
+            parent.setdefault(k, []).extend(v)
+    elif log:
+        commit_storage(log)
+
+@event.listens_for(Session, 'after_rollback')
+def on_session_after_rollback(session):
+    # fired for the root or SAVEPOINT transaction actually rolled back, which
+    # the current transaction belongs to
+    log = _transaction_logs(session).pop(_transaction_scope(session.transaction), None)
+    if log:
+        rollback_storage(log)
+
+@event.listens_for(Session, 'after_transaction_end')
+def on_session_after_transaction_end(session, transaction):
+    # anything left was neither committed nor rolled back, as when a session
+    # is closed, or belonged to a SAVEPOINT closed by an outer rollback
+    log = _transaction_logs(session).pop(transaction, None)
+    if log:
+        rollback_storage(log)
 
 @event.listens_for(Storable, 'before_delete', propagate=True)
 def on_before_delete(mapper, connection, target):
+    session = object_session(target)
     for f in target.storage_fields:
-        proxy = getattr(target, f)
-        proxy.remove()
+        mapper.columns[f].type.on_delete(getattr(target, f), session)
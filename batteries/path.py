@@ -1,13 +1,27 @@
 import os
-import pkg_resources
 import sys
-import imp
+import time
+from importlib import import_module
+
+from concurrent.futures import ThreadPoolExecutor
 
 from six import string_types
 
-ignore_types = [ imp.C_EXTENSION, imp.C_BUILTIN ]
-init_names = [ '__init__%s' % x[0] for x in imp.get_suffixes() if
-               x[0] and x[2] not in ignore_types ]
+from batteries.cache import LRUCache
+
+try:
+    from importlib.machinery import SOURCE_SUFFIXES, BYTECODE_SUFFIXES
+    init_names = [ '__init__%s' % x for x in SOURCE_SUFFIXES + BYTECODE_SUFFIXES ]
+except ImportError:
+    import imp
+    ignore_types = [ imp.C_EXTENSION, imp.C_BUILTIN ]
+    init_names = [ '__init__%s' % x[0] for x in imp.get_suffixes() if
+                   x[0] and x[2] not in ignore_types ]
+
+try:
+    from importlib.resources import files as resource_files
+except ImportError:
+    resource_files = None
 
 def caller_path(path, level=2):
     if not os.path.isabs(path):
@@ -59,7 +73,7 @@ def package_path(package):
     # the result
     prefix = getattr(package, '__abspath__', None)
     if prefix is None:
-        prefix = pkg_resources.resource_filename(package.__name__, '')
+        prefix = PackageAssetDescriptor(package.__name__, '').abspath()
         # pkg_resources doesn't care whether we feed it a package
         # name or a module name within the package, the result
         # will be the same: a directory name to the package itself
@@ -75,6 +89,7 @@ class _CALLER_PACKAGE(object):
         return 'batteries.path.CALLER_PACKAGE'
 
 CALLER_PACKAGE = _CALLER_PACKAGE()
+_missing = object()
 
 class Resolver(object):
     def __init__(self, package=CALLER_PACKAGE):
@@ -91,6 +106,14 @@ class Resolver(object):
                 package = sys.modules[package]
             self.package = package_of(package)
 
+    def bind(self):
+        """replaces :attr:`CALLER_PACKAGE` with the package of the code
+        calling this method, so that later calls resolve against it without
+        inspecting the stack each time; returns the resolver itself"""
+        if self.package is CALLER_PACKAGE:
+            self.package = caller_package()
+        return self
+
     def get_package_name(self):
         if self.package is CALLER_PACKAGE:
             package_name = caller_package().__name__
@@ -139,6 +162,9 @@ class AssetResolver(Resolver):
     ``package``, the resolver will treat relative asset specifications as
     relative to the caller of the :meth:`~batteries.path.AssetResolver.resolve`
     method.
+    Finding the caller costs a stack inspection on every call;
+    ``AssetResolver().bind()`` looks it up once, for the code calling
+    :meth:`~batteries.path.Resolver.bind`.
 
     If a *module* or *module name* (as opposed to a package or package name)
     is supplied as ``package``, its containing package is computed and this
@@ -156,7 +182,59 @@ class AssetResolver(Resolver):
     type was passed the string ``xml.dom``, and ``template.pt`` is supplied
     to the :meth:`~batteries.path.AssetResolver.resolve` method, the resulting
     absolute asset spec would be ``xml.minidom:template.pt``.
+
+    If ``cache_size`` is given, the ``exists()``, ``isdir()`` and
+    ``listdir()`` results of the descriptors returned by this resolver are
+    kept in an :class:`batteries.cache.LRUCache`, available as ``cache``,
+    keyed on the asset's specification, or its path for files outside
+    packages. A cached result is trusted for ``check_interval`` seconds,
+    after which it is kept only if the modification times of the asset and of
+    its directory are unchanged; with a ``check_interval`` of ``None`` results
+    are never rechecked, which suits deployments whose assets do not change.
+    Assets of packages which are not on the filesystem, such as zipped eggs,
+    are never rechecked either. :meth:`invalidate` drops cached results
+    explicitly.
     """
+    def __init__(self, package=CALLER_PACKAGE, cache_size=None, check_interval=1.0,
+                 timer=time.time):
+        super(AssetResolver, self).__init__(package)
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self.check_interval = check_interval
+        self.timer = timer
+
+    def invalidate(self, path=None):
+        """forgets the cached metadata of the asset at the absolute `path`,
+        or with the asset specification `path`, or of every asset"""
+        if self.cache is None:
+            return
+        if path is None:
+            self.cache.clear()
+        else:
+            for key in self.cache.keys():
+                if path in key[1:]:
+                    self.cache.delete(key)
+
+    def metadata(self, descriptor, name):
+        """returns ``descriptor.<name>()``, from the cache if it is still
+        valid"""
+        location, path = _asset_location(descriptor)
+        key = (name, location, path)
+        checks = self.check_interval is not None and path is not None
+        now = self.timer()
+        entry = self.cache.get(key)
+        if entry is not None:
+            value, mtimes, checked = entry
+            if not checks or now - checked < self.check_interval:
+                return value
+            if _mtimes(path) == mtimes:
+                self.cache.set(key, (value, mtimes, now))
+                return value
+
+        mtimes = _mtimes(path) if checks else None
+        value = getattr(descriptor, name)()
+        self.cache.set(key, (value, mtimes, now))
+        return value
+
     def resolve(self, spec):
         """
         Resolve the asset spec named as ``spec`` to an object that has the
@@ -185,21 +263,76 @@ class AssetResolver(Resolver):
         ``None``, and a relative asset specification is passed to
         ``resolve``, an :exc:`ValueError` exception is raised.
         """
+        package = self.package
+        if package is CALLER_PACKAGE and not (os.path.isabs(spec) or ':' in spec):
+            package = caller_package()
+        return self._resolve(spec, package)
+
+    def resolve_many(self, specs, workers=8):
+        """returns a dict mapping each of `specs` to the absolute path of its
+        asset. The paths are computed on up to `workers` threads, so that
+        assets of zipped packages are extracted in parallel."""
+        package = self.package
+        if package is CALLER_PACKAGE:
+            package = caller_package()
+        return self._resolve_many(specs, package, workers)
+
+    def warm(self, spec_prefix, workers=8):
+        """walks the asset tree under `spec_prefix` once and returns a dict
+        mapping the spec of every file in it to its absolute path, as
+        :meth:`resolve_many` does; with a ``cache_size``, this also fills the
+        metadata cache for every directory and file walked"""
+        package = self.package
+        if package is CALLER_PACKAGE:
+            package = caller_package()
+
+        specs = []
+        pending = [spec_prefix]
+        while pending:
+            spec = pending.pop()
+            descriptor = self._resolve(spec, package)
+            if not descriptor.isdir():
+                if descriptor.exists():
+                    specs.append(spec)
+                continue
+
+            for name in descriptor.listdir():
+                if os.path.isabs(spec):
+                    pending.append(os.path.join(spec, name))
+                elif spec.endswith((':', '/')):
+                    pending.append(spec + name)
+                else:
+                    pending.append(spec + '/' + name)
+
+        return self._resolve_many(specs, package, workers)
+
+    def _resolve_many(self, specs, package, workers):
+        descriptors = [self._resolve(spec, package) for spec in specs]
+        if not descriptors:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(workers, len(descriptors))) as executor:
+            paths = executor.map(lambda d: d.abspath(), descriptors)
+            return dict(zip(specs, paths))
+
+    def _resolve(self, spec, package):
         if os.path.isabs(spec):
-            return FSAssetDescriptor(spec)
+            descriptor = FSAssetDescriptor(spec)
+            if self.cache is not None:
+                return CachedAssetDescriptor(descriptor, self)
+            return descriptor
         path = spec
         if ':' in path:
             package_name, path = spec.split(':', 1)
         else:
-            if self.package is CALLER_PACKAGE:
-                package_name = caller_package().__name__
-            else:
-                package_name = getattr(self.package, '__name__', None)
+            package_name = getattr(package, '__name__', None)
             if package_name is None:
                 raise ValueError(
                     'relative spec %r irresolveable without package' % (spec,)
                 )
-        return PkgResourcesAssetDescriptor(package_name, path)
+        descriptor = PackageAssetDescriptor(package_name, path)
+        if self.cache is not None:
+            return CachedAssetDescriptor(descriptor, self)
+        return descriptor
 
 class DottedNameResolver(Resolver):
     """ A class used to resolve a :term:`dotted Python name` to a package or
@@ -234,6 +367,8 @@ class DottedNameResolver(Resolver):
     ``package``, the resolver will treat relative dotted names as relative to
     the caller of the :meth:`~batteries.path.DottedNameResolver.resolve`
     method.
+    As with :class:`AssetResolver`, :meth:`~batteries.path.Resolver.bind`
+    fixes the package to that of its caller.
 
     If a *module* or *module name* (as opposed to a package or package name)
     is supplied as ``package``, its containing package is computed and this
@@ -251,7 +386,28 @@ class DottedNameResolver(Resolver):
     passed the string ``xml.dom``, and ``.minidom`` is supplied to the
     :meth:`~batteries.path.DottedNameResolver.resolve` method, the resulting
     import would be for ``xml.minidom``.
+
+    If ``cache_size`` is given, up to that many resolved names are kept in an
+    :class:`batteries.cache.LRUCache`, available as ``cache``, keyed on the
+    dotted name and the package it was resolved against; names which fail to
+    resolve are not cached. :meth:`invalidate` empties the cache or drops
+    one name from it.
     """
+    def __init__(self, package=CALLER_PACKAGE, cache_size=None):
+        super(DottedNameResolver, self).__init__(package)
+        self.cache = LRUCache(cache_size) if cache_size else None
+
+    def invalidate(self, dotted=None):
+        """forgets the cached resolutions of `dotted`, or of every name"""
+        if self.cache is None:
+            return
+        if dotted is None:
+            self.cache.clear()
+        else:
+            for key in self.cache.keys():
+                if key[0] == dotted:
+                    self.cache.delete(key)
+
     def resolve(self, dotted):
         """
         This method resolves a dotted name reference to a global Python
@@ -315,10 +471,21 @@ class DottedNameResolver(Resolver):
         return dotted
 
     def _resolve(self, dotted, package):
+        cache = self.cache
+        if cache is not None:
+            key = (dotted, getattr(package, '__name__', None))
+            found = cache.get(key, _missing)
+            if found is not _missing:
+                return found
+
         if ':' in dotted:
-            return self._pkg_resources_style(dotted, package)
+            found = self._pkg_resources_style(dotted, package)
         else:
-            return self._zope_dottedname_style(dotted, package)
+            found = self._zope_dottedname_style(dotted, package)
+
+        if cache is not None:
+            cache.set(key, found)
+        return found
 
     def _pkg_resources_style(self, value, package):
         """ package.module:attr style """
@@ -331,8 +498,16 @@ class DottedNameResolver(Resolver):
                 value = package.__name__
             else:
                 value = package.__name__ + value
-        return pkg_resources.EntryPoint.parse(
-            'x=%s' % value).load(False)
+        module, _, attrs = value.partition(':')
+        if not module:
+            raise ValueError('%r is not a valid dotted name' % (value,))
+        found = import_module(module)
+        for attr in attrs.split('.') if attrs else ():
+            try:
+                found = getattr(found, attr)
+            except AttributeError:
+                raise ImportError('%r has no %r attribute' % (found, attr))
+        return found
 
     def _zope_dottedname_style(self, value, package):
         """ package.module.attr style """
@@ -372,8 +547,17 @@ class DottedNameResolver(Resolver):
 
         return found
 
+class _LazyPkgResources(object):
+    """imports pkg_resources on first use, since importing it scans every
+    installed distribution"""
+
+    def __get__(self, instance, cls=None):
+        import pkg_resources
+        return pkg_resources
+
+
 class PkgResourcesAssetDescriptor(object):
-    pkg_resources = pkg_resources
+    pkg_resources = _LazyPkgResources()
 
     def __init__(self, pkg_name, path):
         self.pkg_name = pkg_name
@@ -397,6 +581,111 @@ class PkgResourcesAssetDescriptor(object):
     def exists(self):
         return self.pkg_resources.resource_exists(self.pkg_name, self.path)
 
+class ImportlibAssetDescriptor(object):
+    """asset descriptor backed by :mod:`importlib.resources`; paths are only
+    computed for packages on the filesystem, and are otherwise left to
+    pkg_resources, which extracts them"""
+
+    def __init__(self, pkg_name, path):
+        self.pkg_name = pkg_name
+        self.path = path
+
+    def root(self):
+        try:
+            return resource_files(self.pkg_name)
+        except TypeError:
+            # a module rather than a package
+            module = sys.modules[self.pkg_name]
+            return pathlib.Path(os.path.dirname(os.path.abspath(module.__file__)))
+
+    def resource(self):
+        root = self.root()
+        return root.joinpath(self.path) if self.path else root
+
+    def absspec(self):
+        return '%s:%s' % (self.pkg_name, self.path)
+
+    def abspath(self):
+        root = self.root()
+        if isinstance(root, pathlib.Path):
+            if not self.path:
+                return str(root)
+            return os.path.join(str(root), *self.path.split('/'))
+        return PkgResourcesAssetDescriptor(self.pkg_name, self.path).abspath()
+
+    def stream(self):
+        return self.resource().open('rb')
+
+    def isdir(self):
+        return self.resource().is_dir()
+
+    def listdir(self):
+        return [r.name for r in self.resource().iterdir()]
+
+    def exists(self):
+        resource = self.resource()
+        return resource.is_file() or resource.is_dir()
+
+if resource_files is not None:
+    import pathlib
+    PackageAssetDescriptor = ImportlibAssetDescriptor
+else:
+    PackageAssetDescriptor = PkgResourcesAssetDescriptor
+
+class CachedAssetDescriptor(object):
+    """asset descriptor which answers ``exists()``, ``isdir()`` and
+    ``listdir()`` through the metadata cache of its :class:`AssetResolver`"""
+
+    def __init__(self, descriptor, resolver):
+        self.descriptor = descriptor
+        self.resolver = resolver
+
+    def absspec(self):
+        return self.descriptor.absspec()
+
+    def abspath(self):
+        return self.descriptor.abspath()
+
+    def stream(self):
+        return self.descriptor.stream()
+
+    def isdir(self):
+        return self.resolver.metadata(self.descriptor, 'isdir')
+
+    def listdir(self):
+        return list(self.resolver.metadata(self.descriptor, 'listdir'))
+
+    def exists(self):
+        return self.resolver.metadata(self.descriptor, 'exists')
+
+def _asset_location(descriptor):
+    """returns the key of `descriptor` in the metadata cache, which is its
+    asset spec or, outside packages, its path, and the path of the asset if
+    it is on the filesystem, or None; zipped assets are not extracted"""
+    if isinstance(descriptor, FSAssetDescriptor):
+        return descriptor.path, descriptor.path
+    spec = descriptor.absspec()
+    if isinstance(descriptor, ImportlibAssetDescriptor):
+        if isinstance(descriptor.root(), pathlib.Path):
+            return spec, descriptor.abspath()
+    elif isinstance(descriptor, PkgResourcesAssetDescriptor):
+        pkg_resources = descriptor.pkg_resources
+        provider = pkg_resources.get_provider(descriptor.pkg_name)
+        if isinstance(provider, pkg_resources.DefaultProvider):
+            return spec, descriptor.abspath()
+    return spec, None
+
+def _mtimes(path):
+    """modification times of `path` and of the directory containing it,
+    None for either which does not exist"""
+    mtimes = []
+    for p in (path, os.path.dirname(path.rstrip(os.sep)) or path):
+        try:
+            mtimes.append(os.stat(p).st_mtime)
+        except OSError:
+            mtimes.append(None)
+    return tuple(mtimes)
+
 class FSAssetDescriptor(object):
 
     def __init__(self, path):
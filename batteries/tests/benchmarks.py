@@ -0,0 +1,253 @@
+"""Micro-benchmarks for batteries.
+
+Run with ``python -m batteries.tests.benchmarks [name ...]``; with no names,
+every benchmark is run.
+"""
+import sys
+import timeit
+import warnings
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import SAWarning
+from sqlalchemy.orm import scoped_session, sessionmaker, object_session
+from sqlalchemy.orm.util import has_identity
+
+from batteries.model import Model, initialize_model
+from batteries.model.serializable import serialize
+from batteries.tests.test_model import MyModel, MyGeometricModel
+
+
+def setup_model():
+    warnings.filterwarnings('ignore', category=SAWarning)
+    engine = create_engine('sqlite://')
+    session = scoped_session(sessionmaker())
+    initialize_model(session, engine)
+    Model.metadata.create_all(engine)
+    return session
+
+
+def report(name, baseline, candidate, n):
+    print("{0}: {1:.2f}us -> {2:.2f}us per item ({3:.1f}x)".format(
+        name, baseline / n * 1e6, candidate / n * 1e6, baseline / candidate))
+
+
+def reflective_serialize(self, fields=None, include=None, exclude=None):
+    """Serializable.serialize as it was before serialization plans"""
+    obj = {}
+
+    if fields is None:
+        fields = set(self.__class__.serializable)
+
+        if include is not None:
+            fields |= set(include)
+
+        if exclude is not None:
+            fields ^= set(exclude)
+
+    for prop in fields:
+        serializer_name = 'serialize_' + prop
+        if hasattr(self, serializer_name):
+            obj[prop] = getattr(self, serializer_name)()
+
+        else:
+            is_transient = object_session(self) is None and not has_identity(self)
+            if is_transient:
+                v = self.__dict__.get(prop)
+            else:
+                v = getattr(self, prop)
+            serializers = self.__serializable_args__['serializers']
+            opts = self.__serializable_args__['opts']
+            obj[prop] = serialize(v, serializers, opts)
+
+    return obj
+
+
+def bench_serialize(n=2000, repeat=5):
+    session = setup_model()
+    for i in range(n):
+        session.add(MyModel(name=u'Foo {0}'.format(i), number=3.14, string=u'bar'))
+    session.flush()
+    rows = MyModel.query.all()
+
+    baseline = min(timeit.repeat(lambda: [reflective_serialize(m) for m in rows],
+                                 number=1, repeat=repeat))
+    candidate = min(timeit.repeat(lambda: [m.serialize() for m in rows],
+                                  number=1, repeat=repeat))
+    report('serialize', baseline, candidate, n)
+    session.remove()
+
+
+def bench_serialize_query(n=2000, repeat=5):
+    session = setup_model()
+    for i in range(n):
+        session.add(MyModel(name=u'Foo {0}'.format(i), number=3.14, string=u'bar'))
+    session.flush()
+    session.expunge_all()
+
+    def instances():
+        objs = [m.serialize() for m in MyModel.query]
+        session.expunge_all()
+        return objs
+
+    baseline = min(timeit.repeat(instances, number=1, repeat=repeat))
+    candidate = min(timeit.repeat(lambda: list(MyModel.serialize_query(MyModel.query)),
+                                  number=1, repeat=repeat))
+    report('serialize_query', baseline, candidate, n)
+    session.remove()
+
+
+def bench_keys(n=100000, repeat=3):
+    from hashlib import sha1
+    from uuid import uuid4
+    from batteries.model.hashable import key_strategies, content_key
+
+    def legacy_key():
+        h = sha1()
+        h.update(uuid4().hex)
+        return unicode(h.hexdigest())
+
+    strategies = [('sha1(uuid4)', legacy_key)]
+    strategies += sorted(key_strategies.items())
+    strategies.append(('content', lambda: content_key((u'Foo Bar', 3.14))))
+
+    for name, strategy in strategies:
+        t = min(timeit.repeat(strategy, number=n, repeat=repeat))
+        print("keys {0}: {1:,.0f} keys/s".format(name, n / t))
+
+
+def bench_geometry(n=20000, repeat=5):
+    from geoalchemy2.shape import to_shape
+    from shapely.geometry import Point
+
+    rows = []
+    for i in range(n):
+        m = MyGeometricModel()
+        m.location = Point(i, -i)
+        rows.append(m)
+    wkb = MyGeometricModel.__dict__['location'].property
+
+    def decoded(m):
+        """the descriptor's __get__ as it was before caching"""
+        return to_shape(wkb.__get__(m, MyGeometricModel))
+
+    baseline = min(timeit.repeat(
+        lambda: [(decoded(m).x, decoded(m).y) for m in rows], number=1, repeat=repeat))
+    candidate = min(timeit.repeat(
+        lambda: [(m.location.x, m.location.y) for m in rows], number=1, repeat=repeat))
+    report('geometry x, y', baseline, candidate, n)
+
+
+def bench_spatial_index(n=20000, queries=50, repeat=3):
+    import random
+    from shapely.geometry import Point
+
+    rows = []
+    for i in range(n):
+        m = MyGeometricModel()
+        m.location = Point(random.uniform(0, 100), random.uniform(0, 100))
+        rows.append(m)
+    areas = [Point(random.uniform(0, 100), random.uniform(0, 100)).buffer(2)
+             for i in range(queries)]
+
+    def pairwise():
+        return [[m for m in rows if m.location.within(a)] for a in areas]
+
+    def indexed():
+        index = MyGeometricModel.spatial_index('location', rows)
+        return [index.within(a) for a in areas]
+
+    assert [set(r) for r in pairwise()] == [set(r) for r in indexed()]
+    baseline = min(timeit.repeat(pairwise, number=1, repeat=repeat))
+    candidate = min(timeit.repeat(indexed, number=1, repeat=repeat))
+    report('spatial index within (build included)', baseline, candidate, queries)
+
+
+def bench_resolve(n=20000, repeat=5):
+    from batteries.path import AssetResolver, DottedNameResolver
+
+    def resolve_all(resolver, spec):
+        # resolve is called from here, so CALLER_PACKAGE is this module's
+        for i in range(n):
+            resolver.resolve(spec)
+
+    resolvers = [
+        ('CALLER_PACKAGE', AssetResolver(), DottedNameResolver()),
+        ('bound', AssetResolver().bind(), DottedNameResolver().bind()),
+        ('explicit', AssetResolver('batteries.tests'), DottedNameResolver('batteries.tests')),
+    ]
+    for name, assets, names in resolvers:
+        t = min(timeit.repeat(lambda: resolve_all(assets, 'fixtures/test_image.png'),
+                              number=1, repeat=repeat))
+        u = min(timeit.repeat(lambda: resolve_all(names, 'batteries.tests.benchmarks.report'),
+                              number=1, repeat=repeat))
+        print("resolve {0}: asset {1:.2f}us, dotted name {2:.2f}us".format(
+            name, t / n * 1e6, u / n * 1e6))
+
+
+def bench_import(repeat=5):
+    import subprocess
+
+    script = ("import sys, timeit; t = timeit.default_timer(); import {0}; "
+              "sys.stdout.write('%f %s' % (timeit.default_timer() - t, 'pkg_resources' in sys.modules))")
+    for module in ['pkg_resources', 'batteries.path', 'batteries.model',
+                   'batteries.model.storable']:
+        runs = []
+        for i in range(repeat):
+            output = subprocess.check_output([sys.executable, '-c', script.format(module)])
+            t, loaded = output.split()
+            runs.append(float(t))
+        print("import {0}: {1:.1f}ms (pkg_resources loaded: {2})".format(
+            module, min(runs) * 1e3, loaded.decode()))
+
+
+def bench_key_inserts(n=200000, batch=1000):
+    import os
+    import shutil
+    import tempfile
+    from sqlalchemy import MetaData, Table, Column, Unicode
+    from batteries.model.hashable import key_strategies
+    from batteries.model.types import Ascii
+
+    tmp = tempfile.mkdtemp()
+    try:
+        for name in ('random', 'time'):
+            make_key = key_strategies[name]
+            engine = create_engine('sqlite:///' + os.path.join(tmp, name + '.db'))
+            engine.execute('PRAGMA cache_size = 500')
+            table = Table('keyed', MetaData(),
+                          Column('key', Ascii(40), primary_key=True),
+                          Column('payload', Unicode(100)))
+            table.create(engine)
+
+            start = timeit.default_timer()
+            for i in range(0, n, batch):
+                with engine.begin() as conn:
+                    conn.execute(table.insert(), [{'key': make_key(), 'payload': u'x' * 40}
+                                                  for j in range(batch)])
+            t = timeit.default_timer() - start
+            print("inserts keyed_on={0!r}: {1:,.0f} rows/s".format(name, n / t))
+            engine.dispose()
+    finally:
+        shutil.rmtree(tmp)
+
+
+benchmarks = {
+    'geometry': bench_geometry,
+    'import': bench_import,
+    'key_inserts': bench_key_inserts,
+    'keys': bench_keys,
+    'resolve': bench_resolve,
+    'serialize': bench_serialize,
+    'serialize_query': bench_serialize_query,
+    'spatial_index': bench_spatial_index,
+}
+
+
+def main(argv):
+    names = argv or sorted(benchmarks)
+    for name in names:
+        benchmarks[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
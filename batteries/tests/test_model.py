@@ -1,28 +1,54 @@
+import hashlib
 import os
+import shutil
+import tempfile
 import warnings
 import json
+from io import BytesIO
 import logging
-from unittest import TestCase, skip
+from unittest import TestCase, skip, skipIf
 from datetime import datetime, timedelta
 from dateutil.tz import tzutc
 import string
 import random
+import re
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import scoped_session, sessionmaker, relationship
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.schema import Column, ForeignKey
-from sqlalchemy.types import Unicode, Numeric
+from sqlalchemy.types import Unicode, Numeric, Integer
+from geoalchemy2 import Geometry
+from geoalchemy2.shape import from_shape
+from shapely.geometry import Point, MultiPolygon, Polygon
+from shapely import wkb
+from geoalchemy2.elements import WKBElement
 from sqlalchemy.exc import SAWarning
+from batteries.cache import LRUCache, SharedCache
 from batteries.path import AssetResolver
 
 from batteries.model.types import Ascii
 from batteries.model import Model, initialize_model
-from batteries.model.hashable import Hashable
+from batteries.model.hashable import Hashable, content_key
 from batteries.model.identifiable import Identifiable
 from batteries.model.recordable import Recordable
-from batteries.model.serializable import Serializable
-from batteries.model.storable import Storable, LocalStorage
+from batteries.model.serializable import Serializable, serialization_plan,\
+        invalidate_serialization_plans, _plans
+from batteries.model.storable import Storable, LocalStorage, LocalFileProxy,\
+        set_storage_executor, resolve_base_path, ContentAddressedStorage,\
+        fanout_path, reshard
 from batteries.model.deletable import Deletable
+from batteries.model.geometric import Geometric
 
 
 class MyModel(Hashable, Identifiable, Serializable, Storable, Model, Recordable):
@@ -51,6 +77,38 @@ class MyDeletableModel(Hashable, Deletable, Model):
     name = Column(Unicode(100))
 
 
+class MyStoredModel(Hashable, Storable, Model):
+    _key = Column('key', Ascii(40), primary_key=True)
+    atomic = Column(LocalStorage('batteries.tests:fixtures/', atomic=True))
+    background = Column(LocalStorage('batteries.tests:fixtures/', write_behind=True))
+    deferred = Column(LocalStorage('batteries.tests:fixtures/', deferred_delete=True))
+    content = Column(ContentAddressedStorage('batteries.tests:fixtures/'))
+    sharded = Column(LocalStorage('batteries.tests:fixtures/', fanout=(2, 1)))
+
+
+class MyPlainModel(Model):
+    id = Column(Integer, primary_key=True)
+    name = Column(Unicode(100))
+
+
+class MyPlainChildModel(MyPlainModel):
+    id = Column(Integer, ForeignKey('my_plain_model.id'), primary_key=True)
+    extra = Column(Unicode(100))
+
+
+# geometry columns cannot be created in sqlite, so these are kept out of
+# Model.metadata and only used unsaved
+GeometricBase = declarative_base()
+
+
+class MyGeometricModel(Geometric, GeometricBase):
+    __tablename__ = 'geometric'
+
+    id = Column(Integer, primary_key=True)
+    location = Column(Geometry('POINT', srid=4326))
+    area = Column(Geometry('MULTIPOLYGON', srid=4326))
+
+
 class TestCase(TestCase):
     def setUp(self):
         self.engine = create_engine('sqlite://')
@@ -68,6 +126,24 @@ class TestCase(TestCase):
             SAWarning, r'^sqlalchemy\.sql\.type_api$')
         Model.metadata.create_all(self.engine)
 
+    def use_savepoints(self):
+        """rebinds the session to an engine on which pysqlite's SAVEPOINTs
+        work, by letting SQLAlchemy issue BEGIN itself"""
+        Model.metadata.drop_all(self.engine)
+        self.session.remove()
+        self.engine = create_engine('sqlite://')
+
+        @event.listens_for(self.engine, 'connect')
+        def on_connect(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(self.engine, 'begin')
+        def on_begin(connection):
+            connection.execute('BEGIN')
+
+        initialize_model(self.session, self.engine)
+        Model.metadata.create_all(self.engine)
+
     def tearDown(self):
         MyModel.logging_required = False
         Model.metadata.drop_all(self.engine)
@@ -93,6 +169,106 @@ class TestCase(TestCase):
         except Exception as e:
             self.fail("Unexpected exception raised: {0!s}".format(e))
 
+    def test_get_many(self):
+        for k in 'abcd':
+            self.session.add(MyModel(key=k, name=u'test'))
+        self.session.flush()
+        self.session.expunge(MyModel.get('c'))
+        self.session.expunge(MyModel.get('d'))
+
+        statements = []
+
+        @event.listens_for(self.engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        ms = MyModel.get_many(['d', 'a', 'missing', 'c', 'a'], chunk_size=2)
+        assert [m and m.key for m in ms] == ['d', 'a', None, 'c', 'a']
+        assert len(statements) == 2
+
+        # keys are matched by value, so they must have the loaded type
+        self.session.add(MyPlainModel(id=1, name=u'plain'))
+        self.session.flush()
+        self.session.expunge_all()
+        assert MyPlainModel.get_many(['1']) == [None]
+        assert [m.name for m in MyPlainModel.get_many([1])] == [u'plain']
+
+    def test_cached_get(self):
+        MyModel.__lookup_cache__ = cache = LRUCache(ttl=60)
+        try:
+            self.session.add(MyModel(key='foobar', name=u'Foo Bar'))
+            self.session.flush()
+
+            m = MyModel.get(slug='foo-bar')
+            assert m.key == 'foobar'
+            assert MyModel.get(slug='foo-bar') is m
+            assert (cache.hits, cache.misses) == (1, 1)
+
+            m.slug = u'renamed'
+            self.session.flush()
+            assert MyModel.get(slug='foo-bar') is None
+            assert MyModel.get(slug='renamed') is m
+            assert MyModel.get(name=u'Foo Bar') is m
+            assert len(cache) == 1
+
+        finally:
+            MyModel.__lookup_cache__ = None
+
+    def test_shared_cache(self):
+        class Client(dict):
+            def set(self, key, value, time):
+                self[key] = value
+
+            def delete(self, key):
+                self.pop(key, None)
+
+        cache = SharedCache(Client())
+        cache.set(('slug', u'caf\xe9'), 1)
+        assert cache.get(('slug', u'caf\xe9')) == 1
+        assert all(k.startswith('batteries:') and len(k) == 50 for k in cache.client)
+        cache.delete(('slug', u'caf\xe9'))
+        assert cache.get(('slug', u'caf\xe9'), 2) == 2
+
+    def test_bulk_create(self):
+        self.session.add(MyModel(key='existing', name=u'test'))
+        self.session.flush()
+
+        statements = []
+
+        @event.listens_for(self.engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append((statement, executemany))
+
+        keys = MyModel.bulk_create(
+            [{'name': u'test', 'number': i} for i in range(5)] +
+            [{'key': 'given', 'name': u'given', 'slug': u'taken'}], return_keys=True)
+        assert len(statements) == 3
+        assert sorted(executemany for statement, executemany in statements) == [False, False, True]
+
+        ms = MyModel.get_many(keys)
+        assert [m.slug for m in ms] == \
+            ['test-1', 'test-2', 'test-3', 'test-4', 'test-5', 'taken']
+        assert ms[-1].key == 'given'
+        assert all(len(m.key) == 40 for m in ms[:-1])
+        assert all(m.ctime is not None and m.ctime == m.mtime for m in ms)
+
+        # chunks share one slug allocator, and rows are consumed lazily
+        rows = ({'name': u'chunked'} for i in range(5))
+        assert MyModel.bulk_create(rows, chunk_size=2) == 5
+        assert sorted(m.slug for m in MyModel.query.filter_by(name=u'chunked')) == \
+            ['chunked', 'chunked-1', 'chunked-2', 'chunked-3', 'chunked-4']
+
+        # keys generated by the database are not read back
+        assert MyPlainModel.bulk_create([{'name': u'a'}, {'name': u'b'}]) == 2
+        self.assertRaises(ValueError, MyPlainModel.bulk_create, [{'name': u'c'}],
+                          return_keys=True)
+        self.assertRaises(ValueError, MyPlainChildModel.bulk_create,
+                          [{'name': u'c', 'extra': u'd'}])
+        assert MyPlainModel.bulk_create([{'id': 10, 'name': u'c'}], return_keys=True) == [10]
+        assert MyPlainChildModel.bulk_create([{'id': 11, 'name': u'd', 'extra': u'e'}]) == 1
+        assert MyPlainModel.query.count() == 4
+        assert MyPlainChildModel.get(11).extra == u'e'
+
     def test_hashable_key(self):
         m = MyModel(name=u'test')
         self.session.add(m)
@@ -106,6 +282,24 @@ class TestCase(TestCase):
         except Exception as e:
             self.fail("Unexpected exception raised: {0!s}".format(e))
 
+    def test_hashable_key_strategies(self):
+        m = MyModel(name=u'test')
+        assert re.match(r'^[0-9a-f]{40}$', MyModel.make_key(m))
+        assert MyModel.make_key(m) != MyModel.make_key(m)
+
+        m.keyed_on = ('name', 'number')
+        m.number = 3
+        assert MyModel.make_key(m) == MyModel.make_key(m)
+        assert MyModel.make_key(m) == content_key([u'test', 3])
+
+        m.keyed_on = 'time'
+        keys = [MyModel.make_key(m) for i in range(100)]
+        assert all(re.match(r'^[0-9a-f]{40}$', k) for k in keys)
+        assert [k[:14] for k in keys] == sorted(k[:14] for k in keys)
+
+        m.keyed_on = 'unknown'
+        self.assertRaises(ValueError, MyModel.make_key, m)
+
     def test_recordable_timestamps(self):
         start = datetime.utcnow().replace(tzinfo=tzutc())
 
@@ -133,6 +327,88 @@ class TestCase(TestCase):
         assert s['mtime'] == int(m.mtime.strftime('%s'))
         assert s['ctime'] == int(m.ctime.strftime('%s'))
 
+    def test_serialization_plan(self):
+        m = MyModel(name=u'Foo Bar', number=3.14, string=u'baz')
+        assert m.serialize(fields=['name', 'string']) == \
+            {'name': u'Foo Bar', 'string': u'baz'}
+
+        self.session.add(m)
+        self.session.flush()
+
+        s = m.serialize(exclude=('ctime', 'mtime'))
+        assert sorted(s) == ['key', 'name', 'number', 'string']
+        assert serialization_plan(MyModel, exclude=('ctime', 'mtime')) is \
+            serialization_plan(MyModel, exclude=['ctime', 'mtime'])
+
+        # iterators are frozen once, for both the cache key and the plan
+        fields = {'number': 3.14, 'string': u'baz'}
+        assert m.serialize(fields=(f for f in ['number', 'string'])) == fields
+        assert m.serialize(fields=('number', 'string')) == fields
+        assert sorted(m.serialize(exclude=iter(['key', 'mtime']))) == \
+            ['ctime', 'name', 'number', 'string']
+
+        # serialize_<prop> may be any kind of method
+        MyModel.serialize_string = staticmethod(lambda: u'static')
+        invalidate_serialization_plans()
+        try:
+            assert m.serialize(fields=['name', 'string']) == \
+                {'name': u'Foo Bar', 'string': u'static'}
+        finally:
+            del MyModel.serialize_string
+            invalidate_serialization_plans()
+
+        # the cache holds a bounded number of plans
+        for i in range(_plans.maxsize + 10):
+            serialization_plan(MyModel, exclude=('string',) * i)
+        assert len(_plans) == _plans.maxsize
+
+    def test_serialize_many(self):
+        assert u''.join(MyModel.serialize_many([])) == u'[]'
+
+        for i in range(5):
+            self.session.add(MyModel(name=u'test {0}'.format(i), number=i))
+        self.session.flush()
+
+        expected = [m.serialize(fields=('key', 'name')) for m in
+                    MyModel.query.order_by(MyModel.name)]
+        query = MyModel.query.order_by(MyModel.name)
+
+        chunks = list(MyModel.serialize_many(query, fields=('key', 'name'), chunk_size=2))
+        assert len(chunks) == 4
+        assert json.loads(u''.join(chunks)) == expected
+
+        chunks = MyModel.serialize_many(query, fields=('key', 'name'), lines=True)
+        lines = u''.join(chunks).splitlines()
+        assert [json.loads(l) for l in lines] == expected
+
+    def test_serialize_query(self):
+        for i in range(3):
+            self.session.add(MyModel(name=u'test {0}'.format(i), number=i))
+        self.session.flush()
+
+        query = MyModel.query.order_by(MyModel.name)
+        expected = [m.serialize() for m in query]
+        self.session.expunge_all()
+
+        assert serialization_plan(MyModel).columns is not None
+        assert list(MyModel.serialize_query(query)) == expected
+        assert len(self.session.identity_map) == 0
+
+        fields = ('name', 'nonce')
+        assert serialization_plan(MyModel, fields).columns is None
+        serialized = list(MyModel.serialize_query(query, fields))
+        assert [s['name'] for s in serialized] == [u'test 0', u'test 1', u'test 2']
+        assert all(len(s['nonce']) == 40 for s in serialized)
+
+        # slug's getter fills in a NULL column, so it is not read as a column
+        self.session.execute(MyModel.__table__.insert(), {'key': 'unslugged', 'name': u'test 3'})
+        fields = ('key', 'slug')
+        assert serialization_plan(MyModel, fields).columns is None
+        query = MyModel.query.filter_by(key='unslugged')
+        [serialized] = MyModel.serialize_query(query, fields)
+        assert serialized['key'] == 'unslugged'
+        assert serialized['slug'] is not None
+
     def test_local_storage_field(self):
         m = MyModel(name=u'storable')
 
@@ -158,6 +434,523 @@ class TestCase(TestCase):
 
         assert not os.path.isfile(path)
 
+    def test_local_file_proxy_chunks(self):
+        source = AssetResolver().resolve('batteries.tests:fixtures/test_image.png')
+        with open(source.abspath(), 'rb') as f:
+            data = f.read()
+
+        tmp = tempfile.mkdtemp()
+        try:
+            for i, f in enumerate([open(source.abspath(), 'rb'), BytesIO(data)]):
+                with f:
+                    proxy = LocalFileProxy(tmp, 'copy{0}.png'.format(i), f)
+                    assert proxy.dirty
+                    proxy.close()
+
+                with LocalFileProxy(tmp, 'copy{0}.png'.format(i)).open('rb') as proxy:
+                    chunks = list(proxy.iter_chunks(1000))
+                    assert max(len(c) for c in chunks) == 1000
+                    assert b''.join(chunks) == data
+
+            # a pipe cannot be sent from at an offset, so it is copied
+            r, w = os.pipe()
+            os.write(w, data[:1000])
+            os.close(w)
+            with os.fdopen(r, 'rb') as f, LocalFileProxy(tmp, 'pipe.png').open('wb') as proxy:
+                proxy.copy_from(f)
+            with open(os.path.join(tmp, 'pipe.png'), 'rb') as f:
+                assert f.read() == data[:1000]
+        finally:
+            shutil.rmtree(tmp)
+
+    @skipIf(asyncio is None, 'asyncio is not available')
+    def test_local_file_proxy_async(self):
+        source = AssetResolver().resolve('batteries.tests:fixtures/test_image.png')
+        with open(source.abspath(), 'rb') as f:
+            data = f.read()
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        run = loop.run_until_complete
+        tmp = tempfile.mkdtemp()
+        try:
+            proxy = LocalFileProxy(tmp, 'copy.png')
+            assert run(proxy.aopen('wb')) is proxy
+            with open(source.abspath(), 'rb') as f:
+                run(proxy.acopy_from(f))
+            run(proxy.aclose())
+
+            proxy = run(LocalFileProxy(tmp, 'copy.png').aopen('rb'))
+            assert run(proxy.aread(8)) == data[:8]
+            chunks, it = [], proxy.aiter_chunks(1000)
+            while True:
+                try:
+                    chunks.append(run(it.__anext__()))
+                except StopAsyncIteration:
+                    break
+            assert b''.join(chunks) == data[8:]
+            run(proxy.aclose())
+
+            run(proxy.aremove())
+            assert not os.path.exists(proxy.abspath)
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+            shutil.rmtree(tmp)
+
+    def test_local_file_proxy_mmap(self):
+        source = AssetResolver().resolve('batteries.tests:fixtures/test_image.png')
+        with open(source.abspath(), 'rb') as f:
+            data = f.read()
+
+        proxy = LocalFileProxy(os.path.dirname(os.path.abspath(source.abspath())),
+                               'test_image.png')
+        with proxy:
+            assert proxy.mmap()[:8] == data[:8]
+            view = proxy.view(16, 100)
+            assert len(view) == 100
+            assert bytes(view) == data[16:116]
+            del view
+
+        assert proxy.file is None
+        assert proxy._mmap is None
+
+    def test_storage_fields(self):
+        assert MyModel().storage_fields == ('attachment',)
+        assert sorted(MyStoredModel().storage_fields) == \
+            ['atomic', 'background', 'content', 'deferred', 'sharded']
+        assert resolve_base_path('batteries.tests:fixtures/') == \
+            AssetResolver().resolve('batteries.tests:fixtures/').abspath()
+
+    def test_atomic_storage(self):
+        m = MyStoredModel(key='committed')
+        atomic, background = m.atomic, m.background
+        atomic.filename = 'test_atomic_storage.txt'
+        background.filename = 'test_write_behind_storage.txt'
+
+        with atomic.open('w+') as f:
+            f.write('atomic')
+        with background.open('w+') as f:
+            f.write('write')
+            f.writelines([' ', 'behind'])
+
+        self.session.add(m)
+        self.session.flush()
+        assert not os.path.exists(atomic.abspath)
+
+        try:
+            self.session.commit()
+            background.wait()
+            with open(atomic.abspath) as f:
+                assert f.read() == 'atomic'
+            with open(background.abspath) as f:
+                assert f.read() == 'write behind'
+            assert atomic.temp_path is None and background.temp_path is None
+        finally:
+            for proxy in atomic, background:
+                if os.path.exists(proxy.abspath):
+                    os.unlink(proxy.abspath)
+
+        m = MyStoredModel(key='rolled back')
+        atomic = m.atomic
+        atomic.filename = 'test_atomic_storage_rollback.txt'
+        with atomic.open('w+') as f:
+            f.write('atomic')
+
+        self.session.add(m)
+        self.session.flush()
+        temp_path = atomic.temp_path
+        assert os.path.exists(temp_path)
+
+        self.session.rollback()
+        assert not os.path.exists(temp_path)
+        assert not os.path.exists(atomic.abspath)
+
+        # bulk inserted rows commit their files with the session too
+        atomic = MyStoredModel.__mapper__.columns['atomic'].type.make_proxy(
+            'test_atomic_storage_bulk.txt')
+        with atomic.open('w+') as f:
+            f.write('bulk')
+        MyStoredModel.bulk_create([{'key': 'bulk', 'atomic': atomic}])
+        temp_path = atomic.temp_path
+        assert os.path.exists(temp_path) and not os.path.exists(atomic.abspath)
+        try:
+            self.session.commit()
+            with open(atomic.abspath) as f:
+                assert f.read() == 'bulk'
+            assert not os.path.exists(temp_path)
+            assert MyStoredModel.get('bulk').atomic.filename == 'test_atomic_storage_bulk.txt'
+        finally:
+            if os.path.exists(atomic.abspath):
+                os.unlink(atomic.abspath)
+
+        # a failed background write discards the file rather than committing
+        # what was written before it
+        m = MyStoredModel(key='failed')
+        background = m.background
+        background.filename = 'test_write_behind_failure.txt'
+        with background.open('w+') as f:
+            f.write('good part ')
+            f.write(None)
+        self.session.add(m)
+        self.session.commit()
+        background.wait()
+        assert background.temp_path is None
+        assert not os.path.exists(background.abspath)
+
+    def test_atomic_storage_savepoint(self):
+        self.use_savepoints()
+        m = MyStoredModel(key='outer')
+        m.atomic.filename = 'test_atomic_storage_outer.txt'
+        with m.atomic.open('w+') as f:
+            f.write('outer')
+        self.session.add(m)
+        self.session.flush()
+
+        n = MyStoredModel(key='inner')
+        n.atomic.filename = 'test_atomic_storage_inner.txt'
+        o = MyStoredModel(key='released')
+        o.atomic.filename = 'test_atomic_storage_released.txt'
+        try:
+            self.session.begin_nested()
+            with n.atomic.open('w+') as f:
+                f.write('inner')
+            self.session.add(n)
+            self.session.flush()
+            inner_temp = n.atomic.temp_path
+            self.session.rollback()
+            assert not os.path.exists(inner_temp)
+            assert os.path.exists(m.atomic.temp_path)
+
+            self.session.begin_nested()
+            with o.atomic.open('w+') as f:
+                f.write('released')
+            self.session.add(o)
+            self.session.commit()
+            assert not os.path.exists(o.atomic.abspath)
+
+            self.session.commit()
+            with open(m.atomic.abspath) as f:
+                assert f.read() == 'outer'
+            with open(o.atomic.abspath) as f:
+                assert f.read() == 'released'
+            assert not os.path.exists(n.atomic.abspath)
+            assert MyStoredModel.get('outer') is not None
+        finally:
+            for proxy in m.atomic, n.atomic, o.atomic:
+                if os.path.exists(proxy.abspath):
+                    os.unlink(proxy.abspath)
+
+    def test_deferred_delete(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        set_storage_executor(executor)
+        try:
+            paths = []
+            for key in 'committed', 'rolled back':
+                m = MyStoredModel(key=key)
+                m.deferred.filename = 'test_deferred_delete_{0}.txt'.format(len(paths))
+                with m.deferred.open('w') as f:
+                    f.write(key)
+                paths.append(m.deferred.abspath)
+                self.session.add(m)
+            self.session.commit()
+
+            MyStoredModel.delete(MyStoredModel.get('rolled back'))
+            self.session.flush()
+            self.session.rollback()
+
+            MyStoredModel.delete(MyStoredModel.get('committed'))
+            self.session.flush()
+            assert os.path.exists(paths[0])
+            self.session.commit()
+
+            executor.shutdown(wait=True)
+            assert not os.path.exists(paths[0])
+            assert os.path.exists(paths[1])
+        finally:
+            set_storage_executor(None)
+            for path in paths:
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def test_deferred_delete_savepoint(self):
+        self.use_savepoints()
+        executor = ThreadPoolExecutor(max_workers=1)
+        set_storage_executor(executor)
+        try:
+            paths = {}
+            for key in 'outer', 'rolled back', 'released':
+                m = MyStoredModel(key=key)
+                m.deferred.filename = 'test_deferred_delete_{0}.txt'.format(len(paths))
+                with m.deferred.open('w') as f:
+                    f.write(key)
+                paths[key] = m.deferred.abspath
+                self.session.add(m)
+            self.session.commit()
+
+            MyStoredModel.delete(MyStoredModel.get('outer'))
+            self.session.flush()
+            self.session.begin_nested()
+            MyStoredModel.delete(MyStoredModel.get('rolled back'))
+            self.session.flush()
+            self.session.rollback()
+
+            self.session.begin_nested()
+            MyStoredModel.delete(MyStoredModel.get('released'))
+            self.session.commit()
+            assert os.path.exists(paths['released'])
+            self.session.commit()
+
+            executor.shutdown(wait=True)
+            assert not os.path.exists(paths['outer'])
+            assert not os.path.exists(paths['released'])
+            assert os.path.exists(paths['rolled back'])
+        finally:
+            set_storage_executor(None)
+            for path in paths.values():
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    def test_content_addressed_storage(self):
+        base = resolve_base_path('batteries.tests:fixtures/')
+        ms = []
+        for key in 'abc':
+            m = MyStoredModel(key=key)
+            with m.content.open('w') as f:
+                f.write('same' if key != 'c' else 'different')
+            self.session.add(m)
+            ms.append(m)
+        self.session.commit()
+
+        a, b, c = [MyStoredModel.get(key).content for key in 'abc']
+        try:
+            assert a.filename == b.filename != c.filename
+            digest = hashlib.sha256(b'same').hexdigest()
+            assert a.filename == os.path.join(digest[:2], digest[2:4], digest)
+            with a.open('r') as f:
+                assert f.read() == 'same'
+
+            MyStoredModel.delete(MyStoredModel.get('a'))
+            MyStoredModel.delete(MyStoredModel.get('c'))
+            self.session.commit()
+            assert os.path.exists(b.abspath)
+            assert not os.path.exists(c.abspath)
+
+            MyStoredModel.delete(MyStoredModel.get('b'))
+            self.session.flush()
+            self.session.rollback()
+            assert os.path.exists(b.abspath)
+
+            MyStoredModel.delete(MyStoredModel.get('b'))
+            self.session.commit()
+            assert not os.path.exists(b.abspath)
+
+            d = MyStoredModel.__mapper__.columns['content'].type.make_proxy()
+            with d.open('w') as f:
+                f.write('same')
+            temp_path = d.temp_path
+            MyStoredModel.bulk_create([{'key': 'd', 'content': d}])
+            self.session.commit()
+            assert not os.path.exists(temp_path)
+            assert MyStoredModel.get('d').content.filename == a.filename
+            with open(a.abspath) as f:
+                assert f.read() == 'same'
+        finally:
+            for proxy in a, c:
+                shutil.rmtree(os.path.join(base, proxy.filename[:2]), ignore_errors=True)
+
+    def test_content_addressed_storage_savepoint(self):
+        self.use_savepoints()
+        base = resolve_base_path('batteries.tests:fixtures/')
+        d = MyStoredModel(key='released')
+        with d.content.open('w') as f:
+            f.write('released')
+        self.session.add(d)
+        self.session.commit()
+        released = d.content.abspath
+
+        m = MyStoredModel(key='outer')
+        with m.content.open('w') as f:
+            f.write('outer')
+        self.session.add(m)
+        self.session.flush()
+
+        n = MyStoredModel(key='inner')
+        with n.content.open('w') as f:
+            f.write('inner')
+        inner = None
+        try:
+            self.session.begin_nested()
+            self.session.add(n)
+            self.session.flush()
+            inner = n.content.abspath
+            self.session.rollback()
+            assert not os.path.exists(inner)
+
+            self.session.begin_nested()
+            MyStoredModel.delete(MyStoredModel.get('released'))
+            self.session.commit()
+            assert os.path.exists(released)
+
+            self.session.commit()
+            m = MyStoredModel.get('outer')
+            with m.content.open('r') as f:
+                assert f.read() == 'outer'
+            assert not os.path.exists(released)
+        finally:
+            for path in filter(None, [released, m.content.abspath, inner]):
+                shutil.rmtree(os.path.join(base, os.path.relpath(path, base)[:2]),
+                              ignore_errors=True)
+
+    def test_sharded_storage(self):
+        base = resolve_base_path('batteries.tests:fixtures/')
+        m = MyStoredModel(key='sharded')
+        m.sharded.filename = 'test_sharded_storage.txt'
+        with m.sharded.open('w') as f:
+            f.write('sharded')
+        self.session.add(m)
+        self.session.flush()
+
+        try:
+            digest = hashlib.md5(b'test_sharded_storage.txt').hexdigest()
+            assert m.sharded.abspath == os.path.join(
+                base, digest[:2], digest[2], 'test_sharded_storage.txt')
+            assert os.path.isfile(m.sharded.abspath)
+
+            self.session.expunge_all()
+            m = MyStoredModel.get('sharded')
+            assert m.sharded.filename == 'test_sharded_storage.txt'
+            with m.sharded.open() as f:
+                assert f.read() == 'sharded'
+        finally:
+            shutil.rmtree(os.path.join(base, digest[:2]))
+
+        tmp = tempfile.mkdtemp()
+        try:
+            names = ['file{0}'.format(i) for i in range(20)]
+            for name in names:
+                open(os.path.join(tmp, name), 'w').close()
+
+            assert reshard(tmp, (1, 2), workers=4) == 20
+            for name in names:
+                assert os.path.isfile(os.path.join(tmp, fanout_path(name, (1, 2))))
+            assert not any(os.path.isfile(os.path.join(tmp, n)) for n in os.listdir(tmp))
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_geometry_cache(self):
+        m = MyGeometricModel()
+        m.location = Point(1, 2)
+        p = m.location
+        assert m.location is p
+        assert (p.x, p.y) == (1, 2)
+
+        m.location = Point(3, 4)
+        assert m.location is not p
+        assert m.location.x == 3
+
+        set_committed_value(m, 'location', from_shape(Point(5, 6), srid=4326))
+        assert m.location.x == 5
+
+    def test_geometry_assignment(self):
+        a, b = MyGeometricModel(), MyGeometricModel()
+        a.location = (1, 2)
+        assert a.__dict__['location'].srid == 4326
+        a.location = ((1, 2), 3857)
+        assert a.__dict__['location'].srid == 3857
+
+        a.location = Point(3, 4)
+        assert a.__dict__['location'].srid == 4326
+        assert a.location.x == 3
+        assert a.location.to_wkb() is a.__dict__['location']
+
+        b.location = a.__dict__['location']
+        assert b.__dict__['location'] is a.__dict__['location']
+        b.location = wkb.dumps(Point(5, 6))
+        assert b.__dict__['location'].srid == 4326
+        assert (b.location.x, b.location.y) == (5, 6)
+        self.assertRaises(ValueError, setattr, b, 'location', wkb.dumps(Point(5, 6), hex=True))
+        self.assertRaises(ValueError, setattr, b, 'location', b'POINT (5 6)')
+
+        # one shape assigned to several rows is neither modified nor shared
+        point = Point(7, 8)
+        a.location = point
+        b.location = point
+        assert a.location is not point and b.location is not a.location
+        assert a.location.to_wkb() is a.__dict__['location']
+        assert b.location.to_wkb() is b.__dict__['location']
+        assert 'to_wkb' not in point.__dict__
+
+        square = Polygon([(0, 0), (0, 1), (1, 1), (1, 0)])
+        a.area = square
+        assert a.__dict__['area'].srid == 4326
+        assert a.area.equals(MultiPolygon([square]))
+
+        rows = [MyGeometricModel() for i in range(3)]
+        MyGeometricModel.set_points('location', rows, [(i, -i) for i in range(3)])
+        assert [(m.location.x, m.location.y) for m in rows] == [(0, 0), (1, -1), (2, -2)]
+        assert all(m.__dict__['location'].srid == 4326 for m in rows)
+
+    @skipIf(numpy is None, 'numpy is not available')
+    def test_geometry_arrays(self):
+        rows = [MyGeometricModel() for i in range(4)]
+        for i, m in enumerate(rows[:3]):
+            m.location = Point(i, -i)
+        square = Polygon([(0, 0), (0, 1), (1, 1), (1, 0)])
+        rows[0].area = MultiPolygon([square])
+
+        points = MyGeometricModel.point_array('location', rows)
+        assert points.shape == (4, 2)
+        assert points[:3].tolist() == [[0, 0], [1, -1], [2, -2]]
+        assert numpy.isnan(points[3]).all()
+
+        # big-endian WKB takes the per-row path
+        set_committed_value(rows[1], 'location',
+                            WKBElement(wkb.dumps(Point(7, 8), big_endian=True)))
+        points = MyGeometricModel.point_array('location', rows)
+        assert points[1].tolist() == [7, 8]
+        assert points[2].tolist() == [2, -2]
+
+        areas = MyGeometricModel.geometry_array('area', rows)
+        assert areas[0].equals(MultiPolygon([square]))
+        assert areas[1] is None
+
+    def test_spatial_index(self):
+        rows = [MyGeometricModel() for i in range(100)]
+        for i, m in enumerate(rows):
+            m.location = Point(i % 10, i // 10)
+        index = MyGeometricModel.spatial_index('location', rows[:90], rebuild_threshold=5)
+        assert len(index) == 90
+        assert index.bounds == (0, 0, 9, 8)
+
+        assert set(index.bbox(0, 0, 1, 1)) == set([rows[0], rows[1], rows[10], rows[11]])
+        square = Polygon([(1.5, 1.5), (1.5, 3.5), (3.5, 3.5), (3.5, 1.5)])
+        assert set(index.within(square)) == set([rows[22], rows[23], rows[32], rows[33]])
+        assert index.intersects(Point(5, 5)) == [rows[55]]
+        assert index.nearest(Point(4.1, 4.2)) == [rows[44]]
+        assert set(index.nearest(Point(4.5, 4.5), k=4)) == set([rows[44], rows[45],
+                                                               rows[54], rows[55]])
+
+        for m in rows[90:93]:
+            index.add(m)
+        index.remove(rows[0])
+        assert index.tree is not None and len(index.pending) == 3
+        assert set(index.bbox(0, 0, 0.5, 9.5)) == set(rows[10:91:10])
+        assert index.nearest(Point(-1, -1)) == [rows[1]]
+        assert index.bounds == (0, 0, 9, 9)
+
+        index.add(rows[93])
+        rows[1].location = Point(50, 50)
+        index.update(rows[1])
+        assert not index.pending and len(index) == 93
+        assert index.nearest(Point(-1, -1)) == [rows[10]]
+        assert index.nearest(Point(60, 60)) == [rows[1]]
+        assert index.bounds == (0, 0, 50, 50)
+
+        index.remove(rows[1])
+        index.rebuild()
+        assert index.bounds == (0, 0, 9, 9)
+
     @skip("forget Loggable")
     def test_loggable(self):
         try:
@@ -263,5 +1056,27 @@ class TestCase(TestCase):
         for m in m1, m2, m3:
             assert len(m.slug) == 40
 
+    def test_identifiable_batched(self):
+        statements = []
+
+        @event.listens_for(self.engine, 'before_cursor_execute')
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('SELECT'):
+                statements.append(statement)
+
+        self.session.add(MyModel(key='existing', name=u'test'))
+        self.session.flush()
+        del statements[:]
+
+        for i in range(10):
+            self.session.add(MyModel(key='k{0}'.format(i), name=u'test'))
+        self.session.add(MyModel(key='other', name=u'other_name'))
+        self.session.flush()
+        assert len(statements) == 2
+
+        slugs = [MyModel.get('k{0}'.format(i)).slug for i in range(10)]
+        assert slugs == ['test-{0}'.format(i) for i in range(1, 11)]
+        assert MyModel.get('other').slug == 'other_name'
+
     def test_tablename(self):
         assert MyModel.__table__.name == 'my_model'
@@ -0,0 +1,159 @@
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from batteries.cache import LRUCache
+from batteries.path import AssetResolver, DottedNameResolver, CALLER_PACKAGE,\
+        PkgResourcesAssetDescriptor, ImportlibAssetDescriptor, resource_files
+
+
+class TestCase(TestCase):
+    def test_dotted_name_cache(self):
+        r = DottedNameResolver('batteries', cache_size=2)
+        assert r.resolve('os.path:join') is os.path.join
+        assert r.resolve('os.path:join') is os.path.join
+        assert r.maybe_resolve('.model.Model') is r.resolve('batteries.model:Model')
+        assert (r.cache.hits, r.cache.misses) == (1, 3)
+        assert len(r.cache) == 2
+
+        r.invalidate('batteries.model:Model')
+        assert len(r.cache) == 1
+        r.invalidate()
+        assert len(r.cache) == 0
+
+        self.assertRaises(ImportError, r.resolve, 'batteries.nonexistent')
+        assert len(r.cache) == 0
+        assert DottedNameResolver().cache is None
+
+    def test_bind(self):
+        # the test runner may import this package as batteries.tests or tests
+        package = sys.modules[__name__.rsplit('.', 1)[0]]
+        r = AssetResolver()
+        assert r.package is CALLER_PACKAGE
+        assert r.bind() is r
+        assert r.package is package
+        assert r.resolve('fixtures').absspec() == package.__name__ + ':fixtures'
+
+        r = DottedNameResolver('batteries').bind()
+        assert r.package.__name__ == 'batteries'
+        assert DottedNameResolver().bind().resolve('.test_path:TestCase') is TestCase
+
+    def test_asset_descriptors(self):
+        descriptors = [PkgResourcesAssetDescriptor]
+        if resource_files is not None:
+            descriptors.append(ImportlibAssetDescriptor)
+
+        for descriptor in descriptors:
+            d = descriptor('batteries.tests', 'fixtures/test_image.png')
+            assert d.absspec() == 'batteries.tests:fixtures/test_image.png'
+            assert os.path.isfile(d.abspath())
+            assert d.exists() and not d.isdir()
+            with d.stream() as f:
+                assert f.read(4) == b'\x89PNG'
+
+            d = descriptor('batteries.tests', 'fixtures')
+            assert d.isdir()
+            assert 'test_image.png' in d.listdir()
+            assert not descriptor('batteries.tests', 'missing').exists()
+            assert descriptor('batteries', '').abspath() == \
+                PkgResourcesAssetDescriptor('batteries', '').abspath()
+
+    def test_dotted_names(self):
+        r = DottedNameResolver('batteries')
+        assert r.resolve('os.path:join') is os.path.join
+        assert r.resolve('os') is os
+        assert r.resolve('.cache:LRUCache') is LRUCache
+        assert r.resolve('batteries.cache:LRUCache.get') == LRUCache.get
+        self.assertRaises(ImportError, r.resolve, 'os.path:nonexistent')
+        self.assertRaises(ImportError, r.resolve, 'nonexistent:attr')
+
+    def test_asset_metadata_cache(self):
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, 'asset.txt')
+        try:
+            r = AssetResolver(None, cache_size=10, check_interval=None)
+            d = r.resolve(path)
+            assert not d.exists()
+            assert r.resolve(tmp).listdir() == []
+            open(path, 'w').close()
+            assert not d.exists()
+            assert r.resolve(tmp).listdir() == []
+            r.invalidate(path)
+            assert d.exists() and not d.isdir()
+            assert r.resolve(tmp).listdir() == []
+            r.invalidate()
+            assert r.resolve(tmp).listdir() == ['asset.txt']
+            assert r.cache.hits == 3
+
+            now = [0]
+            r = AssetResolver(None, cache_size=10, check_interval=5, timer=lambda: now[0])
+            d = r.resolve(path)
+            assert d.exists()
+            os.unlink(path)
+            assert d.exists()
+
+            # the removal changed the directory's mtime, so the next check
+            # after check_interval drops the cached result
+            os.utime(tmp, (1, 1))
+            now[0] = 10
+            assert not d.exists()
+
+            assert r.resolve('batteries.tests:fixtures').isdir()
+            fixtures = AssetResolver(None).resolve('batteries.tests:fixtures').abspath()
+            assert ('isdir', 'batteries.tests:fixtures', fixtures) in r.cache
+            r.invalidate(fixtures)
+            assert len(r.cache) == 1
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_zipped_asset_metadata_cache(self):
+        tmp = tempfile.mkdtemp()
+        archive = os.path.join(tmp, 'assets.zip')
+        try:
+            with zipfile.ZipFile(archive, 'w') as z:
+                z.writestr('zipped_assets/__init__.py', '')
+                z.writestr('zipped_assets/asset.txt', 'asset')
+            sys.path.insert(0, archive)
+            try:
+                r = AssetResolver(None, cache_size=10, check_interval=0)
+                assert r.resolve('zipped_assets:asset.txt').exists()
+                assert not r.resolve('zipped_assets:missing.txt').exists()
+                assert not r.resolve('zipped_assets:missing.txt').exists()
+                assert r.cache.hits == 1
+                assert ('exists', 'zipped_assets:asset.txt', None) in r.cache
+            finally:
+                sys.path.remove(archive)
+                sys.modules.pop('zipped_assets', None)
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_resolve_many(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(tmp, 'a', 'b'))
+            for name in ['x.txt', 'a/y.txt', 'a/b/z.txt']:
+                open(os.path.join(tmp, *name.split('/')), 'w').close()
+
+            r = AssetResolver(cache_size=100)
+            paths = r.warm(tmp, workers=2)
+            assert sorted(paths) == [os.path.join(tmp, 'a', 'b', 'z.txt'),
+                                     os.path.join(tmp, 'a', 'y.txt'),
+                                     os.path.join(tmp, 'x.txt')]
+            assert all(k == v for k, v in paths.items())
+            b = os.path.join(tmp, 'a', 'b')
+            assert ('isdir', b, b) in r.cache
+
+            image = r.resolve('fixtures/test_image.png').abspath()
+            paths = r.warm('fixtures')
+            assert paths['fixtures/test_image.png'] == image
+            paths = AssetResolver(None).warm('batteries.tests:fixtures/')
+            assert os.path.samefile(paths['batteries.tests:fixtures/test_image.png'], image)
+
+            paths = r.resolve_many(['fixtures/test_image.png', tmp])
+            assert paths == {'fixtures/test_image.png': image, tmp: tmp}
+            assert r.resolve_many([]) == {}
+        finally:
+            shutil.rmtree(tmp)
@@ -12,6 +12,7 @@ if sys.version_info >= (3,):
     requires.append('python-dateutil')
 else:
     requires.append('python-dateutil<=1.5')
+    requires.append('futures')
 
 setup(
     name='sqlalchemy-batteries',